@@ -1,3 +1,4 @@
+import asyncio
 import json
 from typing import TypeVar, Optional, List, Type, Any
 from pydantic import BaseModel
@@ -55,7 +56,9 @@ class AzureAppConfig(RemoteConfig[T]):
         client = self._get_client()
         key_with_prefix = f"{prefix}{key}" if prefix else key
         try:
-            config_setting = client.get_configuration_setting(
+            # The SDK client is synchronous, so keep the round trip off the event loop
+            config_setting = await asyncio.to_thread(
+                client.get_configuration_setting,
                 key=key_with_prefix,
                 label=label
             )
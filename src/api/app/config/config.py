@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 from pydantic import ConfigDict
 
@@ -28,11 +29,26 @@ class Settings(BaseSettings):
     mcp_timeout_seconds: int = 30
     mcp_max_retries: int = 2
     mcp_npm_registry: str = ""  # Optional custom npm registry
+    mcp_pool_max_idle_per_key: int = 2  # Idle stdio MCP servers kept per command/args/env for definitions with "pooled": true (0 disables pooling)
+    mcp_pool_idle_ttl_seconds: int = 300  # Idle stdio MCP servers older than this are closed by a periodic sweep
+    allow_nested_event_loops: bool = False  # Patch the loop with nest_asyncio if MCP connect nests asyncio.run
+    
+    # Plugin initialization configuration
+    plugin_init_max_retries: int = 2  # Retries for transient connection/timeout errors per tool
+    plugin_init_max_concurrency: int = 4  # Tools initialized concurrently per agent
+    plugin_init_strategy: Literal["wait_all", "wait_first"] = "wait_all"  # Unknown values fail settings validation
+    plugin_warmup_on_startup: bool = True  # Initialize every agent's OpenAPI and MCP plugins once in the background after startup to warm caches
+    
+    # Agent configuration cache
+    agent_config_cache_ttl_seconds: int = 30  # 0 disables caching agent configurations in-process
+    agent_config_cache_max_size: int = 256  # Maximum number of cached agent configurations
     
     # OpenAPI plugin cache configuration
     openapi_cache_enabled: bool = True
     openapi_cache_ttl_seconds: int = 90  # 1 hour default TTL
     openapi_cache_refresh_interval_seconds: int = 300  # 5 minutes default refresh interval
+    openapi_cache_dir: str = ""  # On-disk parsed spec cache directory (defaults to <tempdir>/openapi_specs)
+    openapi_disk_cache_enabled: bool = True  # Persist parsed specs across restarts and workers
 
     model_config = ConfigDict(
         env_file=".env",
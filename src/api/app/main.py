@@ -1,9 +1,17 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.routes import chat_router, base_router, liveness_router, readiness_router, startup_router, deployments_router
 from app.telemetry import setup_telemetry
 from app.services.openapi_spec_cache import OpenAPISpecCache
+from app.plugins.mcp_plugin import MCPStdioProcessPool
+from app.plugins.openapi_plugin import close_operation_http_client
+from app.routes.deployments import close_project_client
+from app.plugins.plugin_manager import warm_up_plugins
+from app.config import get_settings
+from app.dependencies import get_remote_config
+from app.models import Agent
 
 # Configure logging
 logging.basicConfig(
@@ -11,6 +19,15 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+async def _warm_up_plugins() -> None:
+    """Warm the plugin caches for all known agents, logging rather than raising on failure."""
+    try:
+        agents = await get_remote_config().list(model_type=Agent, prefix="agent:")
+        await warm_up_plugins(agents)
+    except Exception as e:
+        # Plugins will be initialized on demand instead
+        logging.error(f"Error warming up plugins: {str(e)}")
+
 # Define lifespan context manager for application startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -29,17 +46,49 @@ async def lifespan(app: FastAPI):
         logging.error(f"Error prefetching OpenAPI specs: {str(e)}")
         logging.info("Application will continue without prefetched specs")
     
+    # Close idle pooled MCP servers past their TTL, whichever server they run
+    MCPStdioProcessPool.get_instance().start()
+    
+    # Warm up plugins for all known agents in the background so the first chat doesn't pay
+    # for it, without holding up startup (and readiness) on MCP server spawns and retries
+    warm_up_task = None
+    if get_settings().plugin_warmup_on_startup:
+        warm_up_task = asyncio.create_task(_warm_up_plugins())
+    
     yield  # Application runs here
     
     # Shutdown: Clean up resources
     logging.info("Shutting down application services...")
     
+    # Stop a warm-up that is still running; its plugins are released as it unwinds
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+        await asyncio.wait({warm_up_task})
+    
     # Clean up the OpenAPI spec cache - wrap in try/except to ensure clean shutdown
     try:
         await openapi_cache.cleanup()
         logging.info("OpenAPI spec cache cleaned up")
     except Exception as e:
         logging.error(f"Error cleaning up OpenAPI spec cache: {str(e)}")
+    
+    # Close the pooled client used for OpenAPI operation calls
+    try:
+        await close_operation_http_client()
+    except Exception as e:
+        logging.error(f"Error closing OpenAPI operation HTTP client: {str(e)}")
+    
+    # Close any idle MCP server processes held by the pool
+    try:
+        await MCPStdioProcessPool.get_instance().close_all()
+    except Exception as e:
+        logging.error(f"Error closing MCP stdio process pool: {str(e)}")
+    
+    # Close the shared Azure AI project client used for listing deployments
+    try:
+        await close_project_client()
+    except Exception as e:
+        logging.error(f"Error closing Azure AI project client: {str(e)}")
 
 # Create FastAPI app with lifespan
 app = FastAPI(lifespan=lifespan)
@@ -1,25 +1,77 @@
 # app/plugins/agent_plugin.py
+import asyncio
 import logging
+import weakref
 from typing import Any, Optional, Dict, List
 from app.models import Tool, Agent
 from app.plugins.base import PluginBase
 from app.config.azure_app_config import AzureAppConfig
 from app.agents.agent_factory import AgentFactory
 from app.services.kernel_factory import KernelFactory
+from app.services.agent_cache import AgentConfigCache
 from app.config.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+
+def _warn_not_cleaned_up(key: str) -> None:
+    """Report an agent plugin entry that was garbage collected without an explicit cleanup."""
+    logger.warning(f"Agent plugin '{key}' was garbage collected without being cleaned up")
+
+
+class _PluginEntry:
+    """Owns the agent, kernel and thread created for a single agent plugin.
+
+    The handler only tracks entries weakly, so whoever holds the entry (normally the
+    request-scoped PluginManager) decides its lifetime and must call ``cleanup``; an entry
+    dropped without it is only reported, as async cleanup can't be driven from a finalizer.
+    """
+
+    __slots__ = ("key", "agent", "kernel", "thread", "_finalizer", "__weakref__")
+
+    def __init__(self, key: str, agent: Any, kernel: Any, thread: Any):
+        self.key = key
+        self.agent = agent
+        self.kernel = kernel
+        self.thread = thread
+        self._finalizer = weakref.finalize(self, _warn_not_cleaned_up, key)
+        self._finalizer.atexit = False
+
+    def detach(self) -> None:
+        """Disarm the GC warning once the entry has been cleaned up explicitly."""
+        self._finalizer.detach()
+
+
 class AgentPluginHandler(PluginBase):
     """Handler for using other Semantic Kernel agents as plugins."""
     
+    __slots__ = ("_agent_plugins", "_config_client", "_prefetched_configs", "_agent_cache")
+    
     def __init__(self):
         """Initialize the agent plugin handler."""
-        self._agent_plugins = {}  # Store created agents by ID
+        # Weakly track created agents by key so forgotten plugins stay reclaimable
+        self._agent_plugins: weakref.WeakValueDictionary[str, _PluginEntry] = weakref.WeakValueDictionary()
         self._config_client = AzureAppConfig(
             connection_string=get_settings().azure_app_config_connection_string,
             endpoint=get_settings().azure_app_config_endpoint
         )
+        self._prefetched_configs: Dict[str, Agent] = {}  # Nested agent configs fetched up front
+        self._agent_cache = AgentConfigCache.get_instance()
+    
+    async def prefetch_agent_configs(self, tool_ids: List[str]) -> None:
+        """Fetch the configurations for all nested agents concurrently."""
+        tool_ids = [tool_id for tool_id in dict.fromkeys(tool_ids) if tool_id not in self._prefetched_configs]
+        if not tool_ids:
+            return
+        
+        results = await asyncio.gather(
+            *[self._agent_cache.get(tool_id, self._config_client) for tool_id in tool_ids],
+            return_exceptions=True
+        )
+        for tool_id, result in zip(tool_ids, results):
+            # Failed lookups are retried (and reported) by initialize
+            if not isinstance(result, BaseException):
+                self._prefetched_configs[tool_id] = result
     
     async def initialize(self, tool: Tool, plugin_manager=None, agent_id=None, **kwargs) -> Any:
         """Initialize an agent as a plugin using the agent ID."""
@@ -28,11 +80,13 @@ class AgentPluginHandler(PluginBase):
             
         try:
             nested_agent_id = tool.id
-            logger.info(f"Initializing agent plugin with ID: {nested_agent_id}{' for parent agent: ' + agent_id if agent_id else ''}")
+            logger.info("Initializing agent plugin with ID: %s%s", nested_agent_id, " for parent agent: " + agent_id if agent_id else "")
             
-            # Get agent configuration
+            # Get agent configuration, preferring one prefetched by the PluginManager
             try:
-                agent_config = await self._config_client.get(key=nested_agent_id, model_type=Agent, prefix="agent:")
+                agent_config = self._prefetched_configs.get(nested_agent_id)
+                if agent_config is None:
+                    agent_config = await self._agent_cache.get(nested_agent_id, self._config_client)
             except Exception as e:
                 logger.error(f"Error retrieving agent configuration: {str(e)}")
                 return None
@@ -51,67 +105,58 @@ class AgentPluginHandler(PluginBase):
                         from app.plugins.plugin_manager import PluginManager
                         async with PluginManager() as new_plugin_manager:
                             plugins = await new_plugin_manager.initialize_plugins(agent_config)
-                    logger.info(f"Initialized {len(plugins)} plugins for nested agent: {agent_id}")
+                    logger.info("Initialized %d plugins for nested agent: %s", len(plugins), agent_id)
                 except Exception as e:
                     logger.error(f"Error initializing plugins for nested agent {agent_id}: {str(e)}")
             
             # Create agent with its plugins
             agent, thread = await AgentFactory.create_agent(kernel, agent_config, plugins)
             
-            # Store reference with compound key
+            # Store a weak reference with compound key; the caller owns the returned entry
             plugin_key = f"{agent_id}:{tool.id}" if agent_id else tool.id
-            self._agent_plugins[plugin_key] = {
-                "agent": agent,
-                "kernel": kernel,
-                "thread": thread
-            }
-            logger.debug(f"Stored agent plugin with key: {plugin_key}")
+            entry = _PluginEntry(plugin_key, agent, kernel, thread)
+            self._agent_plugins[plugin_key] = entry
+            logger.debug("Stored agent plugin with key: %s", plugin_key)
             
-            # Return the agent itself - Semantic Kernel agents implement KernelPlugin interface
-            return agent
+            return entry
             
         except Exception as e:
             logger.error(f"Error initializing agent plugin: {str(e)}", exc_info=True)
             return None
     
-    async def get_kernel_plugin(self, agent: Any) -> Any:
+    async def get_kernel_plugin(self, entry: Optional[_PluginEntry]) -> Any:
         """
         Return the agent directly - newer versions of Semantic Kernel agents 
         already implement KernelPlugin interface.
         """
-        if not agent:
+        if not entry:
             return None
         
         # Just return the agent directly - it already implements the KernelPlugin interface
-        return agent
+        return entry.agent
     
-    async def cleanup(self, agent: Any) -> None:
+    async def cleanup(self, entry: Optional[_PluginEntry]) -> None:
         """Clean up resources used by the agent plugin."""
-        if not agent:
+        if not entry:
             return
         
         try:
-            # Find the agent using value lookup
-            plugin_key = None
-            for key, info in self._agent_plugins.items():
-                if info["agent"] == agent:
-                    plugin_key = key
-                    break
+            plugin_key = entry.key
+            entry.detach()
             
-            if plugin_key:
-                # Extract agent info for logging
-                agent_info = ""
-                if ":" in plugin_key:
-                    parent_agent_id = plugin_key.split(":", 1)[0]
-                    agent_info = f" from parent agent {parent_agent_id}"
-                
-                # Clean up the agent
-                if hasattr(agent, "cleanup"):
-                    await agent.cleanup()
-                
-                # Remove from cache
-                del self._agent_plugins[plugin_key]
-                logger.info(f"Cleaned up agent plugin: {plugin_key.split(':')[-1]}{agent_info}")
+            # Extract agent info for logging
+            agent_info = ""
+            if ":" in plugin_key:
+                parent_agent_id = plugin_key.split(":", 1)[0]
+                agent_info = f" from parent agent {parent_agent_id}"
+            
+            # Clean up the agent
+            if hasattr(entry.agent, "cleanup"):
+                await entry.agent.cleanup()
+            
+            # Remove from cache
+            self._agent_plugins.pop(plugin_key, None)
+            logger.info(f"Cleaned up agent plugin: {plugin_key.split(':')[-1]}{agent_info}")
                 
         except Exception as e:
             logger.error(f"Error cleaning up agent plugin: {str(e)}", exc_info=True)
\ No newline at end of file
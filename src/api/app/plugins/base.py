@@ -6,6 +6,8 @@ import semantic_kernel as sk
 class PluginBase(ABC):
     """Base class for all plugins to implement."""
     
+    __slots__ = ()
+    
     @abstractmethod
     async def initialize(self, config: Dict[str, Any]) -> Any:
         """Initialize the plugin with configuration."""
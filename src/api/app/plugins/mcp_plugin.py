@@ -1,127 +1,501 @@
 # app/plugins/mcp_plugin.py
+import asyncio
+import functools
 import json
 import logging
 import os
 import platform
 import shutil
-import subprocess
-from typing import Dict, Any, Optional, List
+import time
+from collections import deque
+from types import MappingProxyType
+from typing import Deque, Dict, Any, Mapping, Optional, List, Sequence, Tuple
 from opentelemetry import trace
 
 from semantic_kernel.connectors.mcp import MCPStdioPlugin, MCPSsePlugin
 from app.models import Tool
 from app.plugins.base import PluginBase
 from app.config.config import get_settings
+from app.telemetry import start_span
+
+try:
+    import nest_asyncio
+except ImportError:
+    nest_asyncio = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 tracer = trace.get_tracer(__name__)
 
+_IS_WINDOWS = platform.system() == "Windows"
+
+# Seconds an idle pooled MCP server has to answer a ping before it is discarded
+_HEALTH_CHECK_TIMEOUT = 5.0
+
+# Longest time between sweeps of idle pooled MCP servers past their TTL
+_SWEEP_INTERVAL = 60.0
+
+
+async def _safe_connect(plugin: Any) -> None:
+    """
+    Connect an MCP plugin, guarding against nested event loop errors.
+    If the connect path ends up calling asyncio.run while FastAPI's loop is running,
+    the loop is patched with nest_asyncio (when allowed) and the connect is retried.
+    """
+    try:
+        await plugin.connect()
+    except RuntimeError as e:
+        if "already running" not in str(e):
+            raise
+        if not get_settings().allow_nested_event_loops or nest_asyncio is None:
+            raise RuntimeError(
+                f"MCP plugin '{plugin.name}' tried to start a nested event loop. "
+                f"Install nest_asyncio and set ALLOW_NESTED_EVENT_LOOPS=true to allow it."
+            ) from e
+        logger.warning(f"Nested event loop detected while connecting MCP plugin '{plugin.name}', applying nest_asyncio")
+        nest_asyncio.apply()
+        await plugin.connect()
+
+
+class _MCPConnection:
+    """
+    An MCP plugin whose connection is owned by a dedicated long-lived task.
+    The MCP client holds anyio cancel scopes that must be exited by the task that entered
+    them, so connect and close both run in the owner task; requests only borrow the plugin.
+    """
+    
+    __slots__ = ("plugin", "_ready", "_stop", "_task")
+    
+    def __init__(self, plugin: Any):
+        """Initialize the connection for an unconnected plugin."""
+        self.plugin = plugin
+        self._ready: Optional[asyncio.Future] = None
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    async def open(self) -> None:
+        """Start the owner task and wait until the plugin is connected."""
+        self._ready = asyncio.get_running_loop().create_future()
+        # Mark failures as retrieved in case nobody is left waiting for them
+        self._ready.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._task = asyncio.create_task(self._run(), name=f"mcp-connection:{self.plugin.name}")
+        try:
+            await asyncio.shield(self._ready)
+        except asyncio.CancelledError:
+            # The owner task closes the plugin once it has finished connecting
+            self._stop.set()
+            raise
+    
+    async def _run(self) -> None:
+        """Connect the plugin, hold the connection until asked to stop, then close it."""
+        try:
+            await _safe_connect(self.plugin)
+        except asyncio.CancelledError:
+            self._ready.cancel()
+            return
+        except Exception as e:
+            self._ready.set_exception(e)
+            return
+        self._ready.set_result(None)
+        
+        try:
+            await self._stop.wait()
+        finally:
+            try:
+                await self.plugin.close()
+            except Exception as e:
+                logger.error(f"Error closing MCP plugin '{self.plugin.name}': {str(e)}")
+    
+    async def is_healthy(self) -> bool:
+        """Check that the owner task is alive and the server still answers a ping."""
+        if self._task is None or self._task.done():
+            return False
+        session = getattr(self.plugin, "session", None)
+        if session is None:
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout=_HEALTH_CHECK_TIMEOUT)
+        except Exception as e:
+            logger.debug("MCP server '%s' failed its health check: %s", self.plugin.name, e)
+            return False
+        return True
+    
+    async def close(self) -> None:
+        """Ask the owner task to close the plugin and wait for it to finish."""
+        self._stop.set()
+        if self._task is not None:
+            # asyncio.wait neither raises the task's outcome nor cancels it if we are cancelled
+            await asyncio.wait({self._task})
+
+
+PoolKey = Tuple[str, str, Tuple[str, ...], frozenset]
+
+
+def _deep_freeze(value: Any) -> Any:
+    """Recursively turn parsed JSON objects into read-only mappings and arrays into tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _deep_freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_deep_freeze(item) for item in value)
+    return value
+
+
+@functools.lru_cache(maxsize=128)
+def _parse_config_cached(raw: str) -> Mapping[str, Any]:
+    """Parse an MCP definition once per distinct JSON string and return a read-only copy.
+
+    The result is shared by every request using the definition, so it is frozen all the way
+    down; nested values are copied into plain dicts where a plugin needs them.
+    """
+    config = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    return _deep_freeze(config)
+
+
+@functools.lru_cache(maxsize=1)
+def _find_npx_path() -> Optional[str]:
+    """Find npx executable path on the system (resolved once per process)."""
+    # Try shutil.which first
+    npx_path = shutil.which("npx")
+    if npx_path:
+        return npx_path
+        
+    # Check common locations on Windows
+    if _IS_WINDOWS:
+        common_paths = [
+            os.path.join(os.environ.get("ProgramFiles", ""), "nodejs", "npx.cmd"),
+            os.path.join(os.environ.get("APPDATA", ""), "npm", "npx.cmd"),
+            "C:\\Program Files\\nodejs\\npx.cmd"
+        ]
+        
+        for path in common_paths:
+            if os.path.exists(path):
+                return path
+                
+    return "npx"  # Fall back to letting the system resolve it
+
+
+def _freeze_auth_config(auth_config: Mapping[str, Any]) -> frozenset:
+    """Convert a remote MCP auth config into a hashable key for _build_headers."""
+    return frozenset(
+        (key, frozenset(value.items()) if isinstance(value, Mapping) else value)
+        for key, value in auth_config.items()
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _build_headers(auth_config_frozen: frozenset) -> Tuple[Tuple[str, str], ...]:
+    """Build the request headers for a remote MCP auth config once per distinct config."""
+    auth_config = dict(auth_config_frozen)
+    
+    # API key authentication
+    if "apiKey" in auth_config:
+        header_name = auth_config.get("headerName", "Authorization")
+        header_value = auth_config["apiKey"]
+        prefix = auth_config.get("prefix", "Bearer")
+        return ((header_name, f"{prefix} {header_value}" if prefix else header_value),)
+    
+    # Basic header authentication
+    if "headers" in auth_config:
+        return tuple(auth_config["headers"])
+    
+    return ()
+
+
+class MCPStdioProcessPool:
+    """
+    A process-wide pool of connected stdio MCP plugins.
+    Spawning an MCP server (typically via npx) dominates agent start-up, so released
+    plugins are kept connected and handed back out to the next request that asks for
+    the same server. Idle plugins are bounded per key, pinged before reuse and closed
+    by a periodic sweep once they pass the TTL. Only server definitions that opt in
+    with ``"pooled": true`` are pooled, as a shared process carries state between users.
+    """
+    
+    # Singleton instance
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls) -> 'MCPStdioProcessPool':
+        """Get the singleton instance of the pool."""
+        if cls._instance is None:
+            cls._instance = MCPStdioProcessPool()
+        return cls._instance
+    
+    def __init__(self):
+        """Initialize the MCP stdio process pool."""
+        settings = get_settings()
+        self._max_idle_per_key = settings.mcp_pool_max_idle_per_key
+        self._idle_ttl = settings.mcp_pool_idle_ttl_seconds
+        
+        # Idle connections per key, oldest first, with the time they were released
+        self._idle: Dict[PoolKey, Deque[Tuple[_MCPConnection, float]]] = {}
+        
+        # Key and connection of every plugin handed out by the pool, by plugin identity
+        self._leased: Dict[int, Tuple[PoolKey, _MCPConnection]] = {}
+        
+        # Background task closing idle connections past the TTL for every key
+        self._sweeper: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start the periodic sweep of expired idle connections (called on application startup)."""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_periodically(), name="mcp-pool-sweeper")
+    
+    async def _sweep_periodically(self) -> None:
+        """Sweep expired idle connections, including those of keys nobody asks for again."""
+        interval = max(1.0, min(float(self._idle_ttl), _SWEEP_INTERVAL))
+        while True:
+            await asyncio.sleep(interval)
+            await self._sweep()
+    
+    async def _sweep(self) -> None:
+        """Close expired idle connections for every key and forget keys left without any."""
+        for key in list(self._idle):
+            await self._evict_expired(key)
+            if not self._idle.get(key):
+                self._idle.pop(key, None)
+    
+    @staticmethod
+    def _make_key(name: str, command: str, args: Sequence[str], env: Optional[Dict[str, str]]) -> PoolKey:
+        """Build the pool key for a server definition."""
+        return (name, command, tuple(args), frozenset((env or {}).items()))
+    
+    async def acquire(self, name: str, description: str, command: str, args: Sequence[str],
+                      env: Optional[Dict[str, str]] = None, connection_timeout: Optional[int] = None) -> MCPStdioPlugin:
+        """Return a connected plugin for the server, reusing an idle one when available."""
+        key = self._make_key(name, command, args, env)
+        await self._evict_expired(key)
+        
+        connection = None
+        idle = self._idle.get(key)
+        while idle and connection is None:
+            candidate, released_at = idle.pop()
+            try:
+                healthy = await candidate.is_healthy()
+            except asyncio.CancelledError:
+                # The sweeper may have dropped this key's deque in the meantime
+                self._idle.setdefault(key, deque()).append((candidate, released_at))
+                raise
+            if healthy:
+                connection = candidate
+                logger.debug("Reusing pooled MCP server for '%s'", name)
+            else:
+                logger.warning("Discarding dead pooled MCP server for '%s'", name)
+                await candidate.close()
+        
+        if connection is None:
+            connection = _MCPConnection(MCPStdioPlugin(
+                name=name,
+                description=description,
+                command=command,
+                args=list(args),
+                env=env,
+                connection_timeout=connection_timeout
+            ))
+            await connection.open()
+        
+        self._leased[id(connection.plugin)] = (key, connection)
+        return connection.plugin
+    
+    def owns(self, plugin: Any) -> bool:
+        """Check whether a plugin was handed out by this pool."""
+        return id(plugin) in self._leased
+    
+    async def release(self, plugin: MCPStdioPlugin) -> None:
+        """Return a plugin to the pool, closing it if the pool for its key is full."""
+        leased = self._leased.pop(id(plugin), None)
+        if leased is None:
+            logger.warning("Released MCP plugin '%s' was not handed out by the pool", plugin.name)
+            return
+        
+        key, connection = leased
+        await self._evict_expired(key)
+        idle = self._idle.setdefault(key, deque())
+        if len(idle) >= self._max_idle_per_key:
+            await connection.close()
+            return
+        
+        idle.append((connection, time.monotonic()))
+    
+    async def _evict_expired(self, key: PoolKey) -> None:
+        """Close idle connections for a key that have exceeded the idle TTL."""
+        idle = self._idle.get(key)
+        if not idle:
+            return
+        
+        cutoff = time.monotonic() - self._idle_ttl
+        while idle and idle[0][1] < cutoff:
+            connection, _ = idle.popleft()
+            await connection.close()
+    
+    async def close_all(self) -> None:
+        """Stop the sweeper and close every idle connection held by the pool."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.wait({self._sweeper})
+            self._sweeper = None
+        
+        # close never raises, so one slow or failing server doesn't hold up the rest
+        async with asyncio.TaskGroup() as tg:
+            for idle in self._idle.values():
+                while idle:
+                    connection, _ = idle.popleft()
+                    tg.create_task(connection.close())
+        self._idle.clear()
+        logger.info("MCP stdio process pool closed")
+
+
 class MCPPluginHandler(PluginBase):
     """Handles MCP plugins specifically."""
     
+    __slots__ = ("_plugins", "_connections", "settings", "_pool")
+    
     def __init__(self):
         """Initialize the MCP plugin handler."""
         self._plugins = {}  # Track created plugins for cleanup
+        self._connections: Dict[int, _MCPConnection] = {}  # Connections of unpooled plugins, by plugin identity
         self.settings = get_settings()
+        self._pool = MCPStdioProcessPool.get_instance()
     
     async def initialize(self, tool: Tool, agent_id=None, **kwargs) -> Any:
         """Initialize an MCP plugin from tool configuration."""
-        with tracer.start_as_current_span("initialize_mcp_plugin") as span:
+        # Cheap early exits happen before a span is started
+        # Check if MCP plugins are enabled in settings
+        if not self.settings.mcp_enable_plugins:
+            logger.info("MCP plugins are disabled in settings")
+            return None
+            
+        if not tool.mcpDefinition:
+            logger.warning("No MCP definition found for tool: %s", tool.id)
+            return None
+        
+        with start_span(tracer, "initialize_mcp_plugin") as span:
             span.set_attribute("tool_id", tool.id)
             span.set_attribute("tool_name", tool.name)
             if agent_id:
                 span.set_attribute("agent_id", agent_id)
-            
-            # Check if MCP plugins are enabled in settings
-            if not self.settings.mcp_enable_plugins:
-                logger.info("MCP plugins are disabled in settings")
-                return None
-                
-            if not tool.mcpDefinition:
-                logger.warning(f"No MCP definition found for tool: {tool.id}")
-                return None
                 
-            try:                # Parse MCP definition
-                if isinstance(tool.mcpDefinition, str):
-                    config = json.loads(tool.mcpDefinition)
-                else:
-                    config = tool.mcpDefinition
+            try:                # Parse MCP definition (Tool.mcpDefinition is always a JSON string)
+                config = _parse_config_cached(tool.mcpDefinition)
                 
                 # Handle the standard mcpServers format used in agent tools
-                if "mcpServers" in config:
-                    # Extract first server from config for now
-                    server_name = list(config["mcpServers"].keys())[0]
-                    server_config = config["mcpServers"][server_name]
-                    
-                    plugin_name = server_name
-                    description = f"MCP plugin for {server_name}"
-                    
-                    # Extract environment variables if present
-                    env_vars = server_config.get("env")
-                    
-                    # Check if this is a remote MCP server
-                    if server_config.get("type") == "remote":
-                        plugin = self._create_remote_mcp_plugin(server_config, plugin_name, description)
-                        logger.info(f"Creating remote MCP plugin for '{plugin_name}'")
-                    else:
-                        # Default to local MCP plugin
-                        command = server_config.get("command")
-                        args = server_config.get("args", []) 
-                        plugin = self._create_local_mcp_plugin(command, args, plugin_name, description, env_vars)
-                        logger.info(f"Creating local MCP plugin for '{plugin_name}' with command: {command} {' '.join(args)}")                
+                mcp_servers = config.get("mcpServers")
+                if mcp_servers:
+                    servers = list(mcp_servers.items())
                 else:
                     # Fallback to direct config access
-                    plugin_name = tool.name
-                    description = config.get("description", f"MCP plugin for {tool.name}")
-                    
-                    # Extract environment variables if present
-                    env_vars = config.get("env")
-                      # Process direct config (should be indented inside the else block)
-                    if config.get("type") == "remote":
-                        plugin = self._create_remote_mcp_plugin(config, plugin_name, description)
-                        logger.info(f"Creating remote MCP plugin for '{plugin_name}'")
-                    else:
-                        command = config.get("command")
-                        args = config.get("args", [])
-                        plugin = self._create_local_mcp_plugin(command, args, plugin_name, description, env_vars)
-                        logger.info(f"Creating local MCP plugin for '{plugin_name}' with command: {command} {' '.join(args)}")
+                    servers = [(tool.name, config)]
+                
+                # Create and connect all servers concurrently (pooled local plugins arrive already connected)
+                agent_suffix = " in agent: " + agent_id if agent_id else ""
+                logger.info("Connecting to %d MCP server(s) for tool: %s%s", len(servers), tool.id, agent_suffix)
+                tasks = []
+                try:
+                    async with asyncio.TaskGroup() as tg:
+                        for server_name, server_config in servers:
+                            tasks.append(tg.create_task(self._connect_server_safe(server_config, server_name)))
+                except asyncio.CancelledError:
+                    # Hand back servers that finished connecting as the initialization was cancelled
+                    for task in tasks:
+                        if task.done() and not task.cancelled() and not isinstance(task.result(), BaseException):
+                            await self._release(task.result())
+                    raise
+                results = [task.result() for task in tasks]
                 
-                # Connect to the MCP server
-                logger.info(f"Connecting to MCP server for tool: {tool.id}{' in agent: ' + agent_id if agent_id else ''}")
-                await plugin.connect()
-                logger.info(f"Successfully connected to MCP server for tool: {tool.id}{' in agent: ' + agent_id if agent_id else ''}")
+                plugins = [result for result in results if not isinstance(result, BaseException)]
+                errors = [result for result in results if isinstance(result, BaseException)]
+                for (server_name, _), result in zip(servers, results):
+                    if isinstance(result, BaseException):
+                        logger.error(f"Failed to connect MCP server '{server_name}' for tool {tool.id}: {str(result)}")
+                if not plugins:
+                    # Surface the first failure so transient errors can be retried
+                    raise errors[0]
+                logger.info("Successfully connected to %d MCP server(s) for tool: %s%s", len(plugins), tool.id, agent_suffix)
                 
                 # Store for cleanup with compound key
                 plugin_key = f"{agent_id}:{tool.id}" if agent_id else tool.id
-                logger.debug(f"Storing MCP plugin with key: {plugin_key}")
-                self._plugins[plugin_key] = plugin
-                return plugin
+                logger.debug("Storing MCP plugins with key: %s", plugin_key)
+                self._plugins[plugin_key] = plugins
+                return plugins
                 
+            except (ConnectionError, asyncio.TimeoutError) as e:
+                # Let transient connection failures reach the PluginManager so it can retry
+                logger.warning(f"Transient error connecting MCP plugin for tool {tool.id}: {str(e)}")
+                span.record_exception(e)
+                raise
             except Exception as e:
                 logger.error(f"Failed to initialize MCP plugin for tool {tool.id}: {str(e)}", exc_info=True)
                 span.record_exception(e)
                 return None
     
-    def _create_local_mcp_plugin(self, command: str, args: List[str], 
-                                 name: str, description: str, env: Optional[Dict[str, str]] = None) -> MCPStdioPlugin:
-        """Create a local MCP plugin that runs on the server."""
+    async def _connect_server_safe(self, server_config: Mapping[str, Any], name: str) -> Any:
+        """Connect one server, returning rather than raising a connection failure."""
+        try:
+            return await self._connect_server(server_config, name)
+        except Exception as e:
+            return e
+    
+    async def _connect_server(self, server_config: Mapping[str, Any], name: str) -> Any:
+        """Create an MCP plugin for one server definition and make sure it is connected."""
+        description = server_config.get("description") or f"MCP plugin for {name}"
+        plugin = await self._create_mcp_plugin(server_config, name, description)
+        if not self._pool.owns(plugin):
+            connection = _MCPConnection(plugin)
+            await connection.open()
+            self._connections[id(plugin)] = connection
+        return plugin
+    
+    async def _create_mcp_plugin(self, server_config: Mapping[str, Any], name: str, description: str) -> Any:
+        """Create a remote or local MCP plugin from a single server definition."""
+        # Check if this is a remote MCP server
+        if server_config.get("type") == "remote":
+            logger.info("Creating remote MCP plugin for '%s'", name)
+            return self._create_remote_mcp_plugin(server_config, name, description)
+        
+        # Default to local MCP plugin
+        command, args = server_config.get("command"), server_config.get("args", ())
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Creating local MCP plugin for '%s' with command: %s %s", name, command, " ".join(args))
+        env = server_config.get("env")
+        return await self._create_local_mcp_plugin(command, args, name, description, dict(env) if env else None,
+                                                   pooled=server_config.get("pooled") is True)
+    
+    async def _create_local_mcp_plugin(self, command: str, args: Sequence[str], 
+                                       name: str, description: str, env: Optional[Dict[str, str]] = None,
+                                       pooled: bool = False) -> MCPStdioPlugin:
+        """Create a local MCP plugin that runs on the server, or acquire a connected one from the pool if the server opted in."""
         if not command:
             raise ValueError(f"Missing command for MCP plugin: {name}")
         
         # Handle npx command path on Windows
-        if command == "npx" and platform.system() == "Windows":
-            npx_path = self._find_npx_path()
+        if command == "npx" and _IS_WINDOWS:
+            npx_path = _find_npx_path()
             if npx_path:
                 command = npx_path
-                logger.info(f"Using npx from path: {npx_path}")
+                logger.info("Using npx from path: %s", npx_path)
         
         # Log environment variables if provided
         if env:
-            logger.info(f"Setting environment variables for MCP plugin '{name}': {list(env.keys())}")
-            logger.debug(f"Environment variables for '{name}': {env}")
+            logger.info("Setting environment variables for MCP plugin '%s': %s", name, list(env))
+            logger.debug("Environment variables for '%s': %s", name, env)
         
-        # Create the plugin instance with longer timeouts
-        return MCPStdioPlugin(
+        if not pooled:
+            # Connected by the caller and closed on cleanup, so no state outlives this request
+            return MCPStdioPlugin(
+                name=name,
+                description=description,
+                command=command,
+                args=list(args),
+                env=env,
+                connection_timeout=self.settings.mcp_timeout_seconds
+            )
+        
+        # Reuse an idle server process when possible, with longer timeouts
+        return await self._pool.acquire(
             name=name,
             description=description,
             command=command,
@@ -130,7 +504,7 @@ class MCPPluginHandler(PluginBase):
             connection_timeout=self.settings.mcp_timeout_seconds
         )
     
-    def _create_remote_mcp_plugin(self, config: Dict[str, Any], 
+    def _create_remote_mcp_plugin(self, config: Mapping[str, Any], 
                                  name: str, description: str) -> MCPSsePlugin:
         """Create a remote MCP plugin that connects to a remote endpoint."""
         endpoint = config.get("endpoint")
@@ -139,21 +513,9 @@ class MCPPluginHandler(PluginBase):
         
         headers = {}
         
-        # Handle authentication if provided
+        # Handle authentication if provided (headers are built once per distinct auth config)
         if "auth" in config:
-            auth_config = config["auth"]
-            
-            # API key authentication
-            if "apiKey" in auth_config:
-                header_name = auth_config.get("headerName", "Authorization")
-                header_value = auth_config["apiKey"]
-                prefix = auth_config.get("prefix", "Bearer")
-                
-                headers[header_name] = f"{prefix} {header_value}" if prefix else header_value
-            
-            # Basic header authentication
-            elif "headers" in auth_config:
-                headers.update(auth_config["headers"])
+            headers.update(_build_headers(_freeze_auth_config(config["auth"])))
         
         # Create the remote MCP plugin
         return MCPSsePlugin(
@@ -164,41 +526,20 @@ class MCPPluginHandler(PluginBase):
             connection_timeout=self.settings.mcp_timeout_seconds
         )
     
-    def _find_npx_path(self) -> Optional[str]:
-        """Find npx executable path on the system."""
-        # Try shutil.which first
-        npx_path = shutil.which("npx")
-        if npx_path:
-            return npx_path
-            
-        # Check common locations on Windows
-        if platform.system() == "Windows":
-            common_paths = [
-                os.path.join(os.environ.get("ProgramFiles", ""), "nodejs", "npx.cmd"),
-                os.path.join(os.environ.get("APPDATA", ""), "npm", "npx.cmd"),
-                "C:\\Program Files\\nodejs\\npx.cmd"
-            ]
-            
-            for path in common_paths:
-                if os.path.exists(path):
-                    return path
-                    
-        return "npx"  # Fall back to letting the system resolve it
-    
-    async def get_kernel_plugin(self, plugin: Any) -> Any:
-        """Return the MCP plugin for Semantic Kernel."""
-        return plugin
+    async def get_kernel_plugin(self, plugins: List[Any]) -> List[Any]:
+        """Return the MCP plugins (one per configured server) for Semantic Kernel."""
+        return plugins
     
-    async def cleanup(self, plugin: Any) -> None:
-        """Close the MCP plugin connection."""
-        if not plugin:
+    async def cleanup(self, plugins: List[Any]) -> None:
+        """Close the MCP plugin connections."""
+        if not plugins:
             return
             
         try:
-            # Find and remove from tracking using value lookup
+            # Find and remove from tracking using identity lookup
             plugin_key = None
             for key, p in self._plugins.items():
-                if p == plugin:
+                if p is plugins:
                     plugin_key = key
                     break
                     
@@ -208,12 +549,20 @@ class MCPPluginHandler(PluginBase):
                 if ":" in plugin_key:
                     agent_id = plugin_key.split(":", 1)[0]
                     agent_info = f" for agent {agent_id}"
-                    del self._plugins[plugin_key]
+                del self._plugins[plugin_key]
                 
-                # Clean up plugin resources
-                if hasattr(plugin, 'close'):
-                    await plugin.close()
+                for plugin in plugins:
+                    await self._release(plugin)
                     logger.info(f"Cleaned up MCP plugin{agent_info}")
             
         except Exception as e:
-            logger.error(f"Error cleaning up MCP plugin: {str(e)}", exc_info=True)
\ No newline at end of file
+            logger.error(f"Error cleaning up MCP plugin: {str(e)}", exc_info=True)
+    
+    async def _release(self, plugin: Any) -> None:
+        """Return a pooled plugin to the pool, or close an unpooled one."""
+        if self._pool.owns(plugin):
+            await self._pool.release(plugin)
+            return
+        connection = self._connections.pop(id(plugin), None)
+        if connection is not None:
+            await connection.close()
@@ -1,26 +1,109 @@
 # app/plugins/openapi_plugin.py
-import json
+import functools
 import logging
-import httpx
-import yaml
 import re
-from typing import Dict, List, Any, Optional, Callable
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Dict, List, Any, Optional, Callable, Tuple
+import httpx
 from opentelemetry import trace
-from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
 
 from semantic_kernel.functions.kernel_plugin import KernelPlugin
 from semantic_kernel.connectors.openapi_plugin.openapi_function_execution_parameters import OpenAPIFunctionExecutionParameters
 from semantic_kernel.exceptions.function_exceptions import FunctionInitializationError
-from pydantic.errors import PydanticUserError
-from pydantic_core._pydantic_core import ValidationError
+from pydantic import ValidationError
 
 from app.models import Tool, Authentication
 from app.plugins.base import PluginBase
 from app.services.openapi_spec_cache import OpenAPISpecCache
+from app.telemetry import start_span
 
 logger = logging.getLogger(__name__)
 tracer = trace.get_tracer(__name__)
 
+# Patterns used to pull the offending function name out of SK initialization errors
+_FUNC_NAME_RE = re.compile(r'function\s+([A-Za-z0-9_.-]+\.[A-Za-z0-9_.-]+)')
+_INPUT_VALUE_RE = re.compile(r"input_value='([^']+)'")
+
+# HTTP methods exposed as plugin functions (restricted to safer operations);
+# both cases are listed so the predicate can skip .lower() on every operation
+# (OpenAPISpecCache prunes all other operations from large specs)
+_ALLOWED_METHODS = frozenset({"get", "post", "put", "GET", "POST", "PUT"})
+
+
+def _is_allowed_operation(operation: Any) -> bool:
+    """Operation selection predicate shared by every OpenAPI plugin."""
+    return operation.method in _ALLOWED_METHODS
+
+
+# Timeout for OpenAPI operation calls, matching the client Semantic Kernel creates per call
+_OPERATION_TIMEOUT = httpx.Timeout(5.0)
+
+# Pooled client for OpenAPI operation calls (created lazily); separate from the spec-fetching client
+_operation_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_operation_http_client() -> httpx.AsyncClient:
+    """Get the client OpenAPI operations are called with, creating it on first use.
+    
+    The client is shared by every user and session, so it never stores cookies: a
+    Set-Cookie from one caller's tool call must not be replayed on anyone else's.
+    """
+    global _operation_http_client
+    if _operation_http_client is None:
+        _operation_http_client = httpx.AsyncClient(
+            timeout=_OPERATION_TIMEOUT,
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+        )
+    return _operation_http_client
+
+
+async def close_operation_http_client() -> None:
+    """Close the OpenAPI operation client (called on application shutdown)."""
+    global _operation_http_client
+    if _operation_http_client is not None:
+        await _operation_http_client.aclose()
+        _operation_http_client = None
+
+
+# User-facing error templates
+_HYPHENATED_FUNCTION_NAME_ERROR = (
+    "Function name '%s' in OpenAPI spec contains invalid characters. "
+    "Function names must only contain letters, numbers, and underscores (no hyphens). "
+    "Please update your OpenAPI spec to use compliant operation IDs."
+)
+_INVALID_FUNCTION_NAME_ERROR = (
+    "Function name '%s' in OpenAPI spec contains invalid characters. "
+    "Function names must only contain letters, numbers, and underscores. "
+    "Please update your OpenAPI spec to use compliant operation IDs."
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _build_auth_callback(auth_signature: Tuple[Tuple[str, Optional[str], Optional[str]], ...]) -> Optional[Callable]:
+    """Build the OpenAPI auth callback for a (type, headerName, headerValue) signature."""
+    # Resolve all header authentications into a single dict up front
+    static_headers = {
+        header_name: header_value
+        for auth_type, header_name, header_value in auth_signature
+        if auth_type == "Header" and header_name and header_value
+    }
+    
+    # EntraID-AppIdentity is not enabled yet; when it is, wrap static_headers with a token from one shared DefaultAzureCredential
+    
+    # No header authentications configured
+    if not static_headers:
+        return None
+    
+    def header_auth_callback(**kwargs):
+        headers = kwargs.get("headers") or {}
+        headers.update(static_headers)
+        return headers
+    
+    return header_auth_callback
+
+
 class OpenAPIPluginError(Exception):
     """Exception raised for OpenAPI plugin errors that should be shown to users."""
     
@@ -36,9 +119,13 @@ class OpenAPIPluginError(Exception):
 class OpenAPIPluginHandler(PluginBase):
     """Handles OpenAPI plugins for AI Agents."""
     
+    __slots__ = ("_plugins", "_plugin_to_key", "_spec_cache")
+    
     def __init__(self):
         """Initialize the OpenAPI plugin handler."""
-        self._plugins = {}  # Track created plugins for cleanup
+        # Track created plugins weakly so plugins that are never cleaned up can still be collected
+        self._plugins: Dict[str, Tuple[weakref.ref, str]] = {}
+        self._plugin_to_key: Dict[int, str] = {}  # Reverse index from plugin identity to its key
         self._spec_cache = OpenAPISpecCache.get_instance()
     
     async def initialize(self, tool: Tool, agent_id=None, **kwargs) -> Any:
@@ -46,7 +133,7 @@ class OpenAPIPluginHandler(PluginBase):
         if tool.type != "OpenAPI":
             return None
             
-        with tracer.start_as_current_span("initialize_openapi_plugin") as span:
+        with start_span(tracer, "initialize_openapi_plugin") as span:
             span.set_attribute("tool_id", tool.id)
             span.set_attribute("tool_name", tool.name)
             
@@ -73,39 +160,15 @@ class OpenAPIPluginHandler(PluginBase):
                     logger.error(error_msg)
                     raise OpenAPIPluginError(error_msg, tool_id=tool.id, tool_name=tool.name, spec_url=spec_url)
                 
-                # Create OpenAPI execution parameters
-                execution_params = OpenAPIFunctionExecutionParameters(
-                    auth_callback=auth_callback,
-                    enable_dynamic_payload=True,
-                    enable_payload_namespacing=True,
-                    # Restrict to safer operations
-                    operation_selection_predicate=lambda op: op.method.lower() in ["get", "post", "put"]
-                )
-                
-                # Create the plugin
+                # Each request gets its own plugin; only the parsed spec is shared through the spec cache
                 plugin_name = tool.name.replace(" ", "")
-                try:
-                    kernel_plugin = KernelPlugin.from_openapi(
-                        plugin_name=plugin_name,
-                        openapi_parsed_spec=parsed_spec,
-                        execution_settings=execution_params
-                    )                
-                except FunctionInitializationError as e:
-                    # Extract useful information from the exception chain
-                    error_msg = self._extract_user_friendly_error(e, tool.name)
-                    logger.error(f"Failed to initialize OpenAPI plugin: {error_msg}", exc_info=True)
-                    raise OpenAPIPluginError(error_msg, original_error=e, tool_id=tool.id, tool_name=tool.name, spec_url=spec_url)
-                except Exception as e:
-                    error_msg = f"Failed to initialize OpenAPI plugin '{tool.name}': {str(e)}"
-                    logger.error(error_msg, exc_info=True)
-                    raise OpenAPIPluginError(error_msg, original_error=e, tool_id=tool.id, tool_name=tool.name, spec_url=spec_url)
+                # Operation calls share a pooled, cookie-less client instead of connecting per call
+                http_client = _get_operation_http_client()
+                kernel_plugin = self._build_plugin(tool, plugin_name, spec_url, parsed_spec, auth_callback, http_client)
                 
                 # Store with compound key
                 plugin_key = f"{agent_id}:{tool.id}" if agent_id else tool.id
-                self._plugins[plugin_key] = {
-                    "plugin": kernel_plugin,
-                    "name": plugin_name
-                }
+                self._track(plugin_key, kernel_plugin, plugin_name)
                 
                 logger.info(f"Successfully initialized OpenAPI plugin: {tool.name}{' for agent: ' + agent_id if agent_id else ''}")
                 return kernel_plugin
@@ -118,7 +181,37 @@ class OpenAPIPluginHandler(PluginBase):
                 logger.error(error_msg, exc_info=True)
                 span.record_exception(e)
                 raise OpenAPIPluginError(error_msg, original_error=e, tool_id=tool.id, tool_name=tool.name, spec_url=tool.specUrl or "")
-                
+    
+    def _build_plugin(self, tool: Tool, plugin_name: str, spec_url: str,
+                      parsed_spec: Dict[str, Any], auth_callback: Optional[Callable], http_client: Any) -> KernelPlugin:
+        """Build a KernelPlugin from a parsed spec, raising OpenAPIPluginError on failure."""
+        # Create OpenAPI execution parameters
+        execution_params = OpenAPIFunctionExecutionParameters(
+            auth_callback=auth_callback,
+            http_client=http_client,
+            enable_dynamic_payload=True,
+            enable_payload_namespacing=True,
+            # Restrict to safer operations
+            operation_selection_predicate=_is_allowed_operation
+        )
+        
+        # Create the plugin
+        try:
+            return KernelPlugin.from_openapi(
+                plugin_name=plugin_name,
+                openapi_parsed_spec=parsed_spec,
+                execution_settings=execution_params
+            )
+        except FunctionInitializationError as e:
+            # Extract useful information from the exception chain
+            error_msg = self._extract_user_friendly_error(e, tool.name)
+            logger.error(f"Failed to initialize OpenAPI plugin: {error_msg}", exc_info=True)
+            raise OpenAPIPluginError(error_msg, original_error=e, tool_id=tool.id, tool_name=tool.name, spec_url=spec_url)
+        except Exception as e:
+            error_msg = f"Failed to initialize OpenAPI plugin '{tool.name}': {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            raise OpenAPIPluginError(error_msg, original_error=e, tool_id=tool.id, tool_name=tool.name, spec_url=spec_url)
+    
     def _extract_user_friendly_error(self, error: Exception, tool_name: str) -> str:
         """Extract a user-friendly error message from exception chain."""
         # Get the full error string to use in pattern matching
@@ -128,14 +221,12 @@ class OpenAPIPluginHandler(PluginBase):
         if isinstance(error, FunctionInitializationError) or "KernelFunction failed to initialize" in full_error_str:
             # Check for the function name error pattern in the raw error message
             # This handles both ValidationError cases and when the error is re-wrapped
-            function_name_match = re.search(r'function\s+([A-Za-z0-9_.-]+\.[A-Za-z0-9_.-]+)', full_error_str)
+            function_name_match = _FUNC_NAME_RE.search(full_error_str)
             if function_name_match:
                 invalid_function = function_name_match.group(1)
                 # If we found a function name with a hyphen, that's likely our issue
                 if '-' in invalid_function:
-                    return (f"Function name '{invalid_function}' in OpenAPI spec contains invalid characters. "
-                            f"Function names must only contain letters, numbers, and underscores (no hyphens). "
-                            f"Please update your OpenAPI spec to use compliant operation IDs.")
+                    return _HYPHENATED_FUNCTION_NAME_ERROR % (invalid_function,)
             
             # Look for validation error patterns deeper in the exception chain
             cause = error.__cause__
@@ -146,20 +237,15 @@ class OpenAPIPluginHandler(PluginBase):
                         if error_item.get("type") == "string_pattern_mismatch" and error_item.get("loc") == ("name",):
                             invalid_name = error_item.get("input")
                             if invalid_name:
-                                return (f"Function name '{invalid_name}' in OpenAPI spec contains invalid characters. " 
-                                        f"Function names must only contain letters, numbers, and underscores. "
-                                        f"Please update your OpenAPI spec to use compliant operation IDs.")
+                                return _INVALID_FUNCTION_NAME_ERROR % (invalid_name,)
                 
                 # Also check the error message from the cause
                 cause_str = str(cause)
                 if "string_pattern_mismatch" in cause_str and "^[0-9A-Za-z_]+$" in cause_str:
                     # Try to extract the function name from the error message
-                    name_match = re.search(r"input_value='([^']+)'", cause_str)
+                    name_match = _INPUT_VALUE_RE.search(cause_str)
                     if name_match:
-                        invalid_name = name_match.group(1)
-                        return (f"Function name '{invalid_name}' in OpenAPI spec contains invalid characters. " 
-                                f"Function names must only contain letters, numbers, and underscores. "
-                                f"Please update your OpenAPI spec to use compliant operation IDs.")
+                        return _INVALID_FUNCTION_NAME_ERROR % (name_match.group(1),)
             
             # If we found KernelFunction failed message but couldn't extract specifics
             if "KernelFunction failed to initialize: Failed to create KernelFunctionMetadata" in full_error_str:
@@ -170,6 +256,20 @@ class OpenAPIPluginHandler(PluginBase):
         # Generic user-friendly message with original error
         return f"Error initializing OpenAPI plugin '{tool_name}': {full_error_str}"
     
+    def _track(self, plugin_key: str, kernel_plugin: KernelPlugin, plugin_name: str) -> None:
+        """Track a plugin weakly, dropping its entries once the plugin is garbage collected."""
+        plugin_id = id(kernel_plugin)
+        
+        def forget(ref: weakref.ref) -> None:
+            entry = self._plugins.get(plugin_key)
+            if entry is not None and entry[0] is ref:
+                del self._plugins[plugin_key]
+            if self._plugin_to_key.get(plugin_id) == plugin_key:
+                del self._plugin_to_key[plugin_id]
+        
+        self._plugins[plugin_key] = (weakref.ref(kernel_plugin, forget), plugin_name)
+        self._plugin_to_key[plugin_id] = plugin_key
+    
     async def get_kernel_plugin(self, plugin: Any) -> Optional[KernelPlugin]:
         """Return the plugin for Semantic Kernel."""
         # The plugin is already a KernelPlugin, so return it directly
@@ -178,12 +278,7 @@ class OpenAPIPluginHandler(PluginBase):
     async def cleanup(self, plugin: Any) -> None:
         """Clean up resources used by the plugin."""
         # Find and remove from tracking
-        plugin_key = None
-        for key, info in self._plugins.items():
-            if info["plugin"] == plugin:
-                plugin_key = key
-                break
-                
+        plugin_key = self._plugin_to_key.pop(id(plugin), None)
         if plugin_key:
             # Extract agent info for logging
             agent_info = ""
@@ -191,7 +286,7 @@ class OpenAPIPluginHandler(PluginBase):
                 agent_id = plugin_key.split(":", 1)[0]
                 agent_info = f" for agent {agent_id}"
                 
-            del self._plugins[plugin_key]
+            self._plugins.pop(plugin_key, None)
             logger.info(f"Cleaned up OpenAPI plugin{agent_info}")
     
     def _create_auth_callback(self, authentications: List[Authentication]) -> Optional[Callable]:
@@ -199,46 +294,7 @@ class OpenAPIPluginHandler(PluginBase):
         if not authentications:
             return None
         
-        auth_callbacks = []
-        
-        for auth in authentications:
-            if auth.type == "Header":
-                header_name = auth.headerName
-                header_value = auth.headerValue
-                
-                if header_name and header_value:
-                    # Create a closure for header authentication
-                    def header_auth_callback(name=header_name, value=header_value, **kwargs):
-                        headers = kwargs.get("headers", {})
-                        headers[name] = value
-                        return headers
-                    
-                    auth_callbacks.append(header_auth_callback)
-        
-            # if auth.type == "EntraID-AppIdentity":
-            #     # You may want to allow specifying a resource/audience in the Authentication model
-            #     resource = getattr(auth, "resource", "https://management.azure.com/.default")
-            #     async def entra_id_auth_callback(**kwargs):
-            #         credential = DefaultAzureCredential()
-            #         token = await credential.get_token(resource)
-            #         headers = kwargs.get("headers", {})
-            #         headers["Authorization"] = f"Bearer {token.token}"
-            #         await credential.close()
-            #         return headers
-            #     auth_callbacks.append(entra_id_auth_callback)
-        # No auth callbacks created
-        if not auth_callbacks:
-            return None
-        
-        # Create combined auth callback if multiple methods
-        if len(auth_callbacks) == 1:
-            return auth_callbacks[0]
-        else:
-            # Combine multiple callbacks
-            def combined_auth_callback(**kwargs):
-                headers = kwargs.get("headers", {})
-                for callback in auth_callbacks:
-                    headers = callback(headers=headers, **kwargs)
-                return headers
-            
-            return combined_auth_callback
\ No newline at end of file
+        # Tools that share the same authentications share one callback; repeated
+        # entries are dropped so copy-pasted duplicates don't produce distinct callbacks
+        auth_signature = tuple(dict.fromkeys((auth.type, auth.headerName, auth.headerValue) for auth in authentications))
+        return _build_auth_callback(auth_signature)
\ No newline at end of file
@@ -1,6 +1,8 @@
 # app/plugins/plugin_manager.py
+import asyncio
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Tuple, Type
+from app.config.config import get_settings
 from app.models import Tool, Agent
 from app.plugins.base import PluginBase
 from app.plugins.mcp_plugin import MCPPluginHandler
@@ -9,9 +11,59 @@ from app.plugins.agent_plugin import AgentPluginHandler
 
 logger = logging.getLogger(__name__)
 
+# Errors that indicate a transient failure worth retrying during plugin initialization
+RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (ConnectionError, asyncio.TimeoutError)
+
+# Strategies accepted by PluginManager.initialize_plugins (mirrors the plugin_init_strategy setting)
+_INIT_STRATEGIES = ("wait_all", "wait_first")
+
+# Tool types whose plugins only fill local caches when initialized, and so are safe to warm up
+_WARM_UP_TOOL_TYPES = frozenset({"OpenAPI", "ModelContextProtocol"})
+
+
+async def _with_retry(coro_factory: Callable[[], Awaitable[Any]], max_retries: int,
+                      retry_on: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS) -> Any:
+    """Await a fresh coroutine from the factory, retrying transient errors with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await coro_factory()
+        except retry_on as e:
+            if attempt >= max_retries:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Transient error initializing plugin (attempt {attempt + 1}/{max_retries + 1}), retrying in {delay}s: {str(e)}")
+            await asyncio.sleep(delay)
+
+
+async def warm_up_plugins(agents: List[Agent]) -> None:
+    """Initialize and release every agent's OpenAPI and MCP plugins once so the first chat finds warm caches.
+    
+    Plugins themselves are per request, but initializing them populates the process-wide
+    caches they draw on: parsed OpenAPI specs and auth callbacks, parsed MCP definitions
+    and the pool of idle local MCP server processes. Agent tools are skipped: creating a
+    nested agent can create a remote Foundry agent, which a warm-up must not do.
+    """
+    async def warm_up(agent: Agent) -> None:
+        async with PluginManager() as plugin_manager:
+            await plugin_manager.initialize_plugins(agent)
+    
+    agents = [
+        agent.model_copy(update={"tools": [tool for tool in agent.tools if tool.type in _WARM_UP_TOOL_TYPES]})
+        for agent in agents
+    ]
+    agents = [agent for agent in agents if agent.tools]
+    results = await asyncio.gather(*[warm_up(agent) for agent in agents], return_exceptions=True)
+    for agent, result in zip(agents, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Failed to warm up plugins for agent '{agent.id}': {str(result)}")
+    logger.info(f"Warmed up plugins for {len(agents)} agents")
+
+
 class PluginManager:
     """Manages the lifecycle of plugins for an agent."""
     
+    __slots__ = ("_plugin_handlers", "_active_plugins", "_settings")
+    
     def __init__(self):
         self._plugin_handlers = {
             "ModelContextProtocol": MCPPluginHandler(),
@@ -19,6 +71,7 @@ class PluginManager:
             "Agent": AgentPluginHandler()
         }
         self._active_plugins = []
+        self._settings = get_settings()
         
     async def __aenter__(self):
         """Context manager entry"""
@@ -29,47 +82,118 @@ class PluginManager:
         await self.cleanup_all_plugins()
         return False  # Do not suppress exceptions
     
-    async def initialize_plugins(self, agent: Agent) -> List[Any]:
-        """Initialize all plugins defined in agent configuration."""
-        plugins = []
+    async def initialize_plugins(self, agent: Agent, strategy: Optional[str] = None) -> List[Any]:
+        """Initialize all plugins defined in agent configuration.
+        
+        Tools are initialized concurrently (bounded by ``plugin_init_max_concurrency``).
+        With the ``wait_all`` strategy every tool is awaited; with ``wait_first`` the
+        remaining tools are cancelled as soon as one plugin is available, so agents with
+        fallback tools don't wait on the slowest one.
+        """
+        strategy = strategy or self._settings.plugin_init_strategy
+        if strategy not in _INIT_STRATEGIES:
+            raise ValueError(f"Unknown plugin initialization strategy '{strategy}', expected one of: {', '.join(_INIT_STRATEGIES)}")
+        tools = [tool for tool in agent.tools if tool.type in self._plugin_handlers]
+        if not tools:
+            return []
+        
+        # Fetch all nested agent configurations in one round of concurrent requests
+        agent_tool_ids = [tool.id for tool in tools if tool.type == "Agent"]
+        if agent_tool_ids:
+            await self._plugin_handlers["Agent"].prefetch_agent_configs(agent_tool_ids)
         
-        for tool in agent.tools:
-            if tool.type in self._plugin_handlers:
-                handler = self._plugin_handlers[tool.type]
-                try:
-                    # Pass both plugin_manager and agent_id to all handlers
-                    # This resolves an issue where sub-agents were being initialized and then cleaned up immediately
-                    # and ensures plugins have unique keys across different agents
-                    if tool.type == "Agent":
-                        plugin_data = await handler.initialize(tool, plugin_manager=self, agent_id=agent.id)
-                    else:
-                        plugin_data = await handler.initialize(tool, agent_id=agent.id)
-                    if plugin_data:
-                        # Store both the handler and the plugin data for cleanup
-                        self._active_plugins.append((handler, plugin_data))
-                        # Get the kernel plugin representation
-                        kernel_plugin = await handler.get_kernel_plugin(plugin_data)
-                        if kernel_plugin:
-                            plugins.append(kernel_plugin)
-                except OpenAPIPluginError:
-                    # Explicitly re-raise OpenAPIPluginError to propagate to chat service
-                    logger.error(f"OpenAPIPluginError during plugin initialization for tool: {tool.id}")
-                    raise
-                except Exception as e:
-                    # Log other initialization errors but don't raise generic exceptions
-                    # so that other plugins can still be loaded
-                    logger.error(f"Error initializing plugin for tool {tool.id}: {str(e)}", exc_info=True)
-                    # Don't add this failed plugin to the active plugins
+        semaphore = asyncio.Semaphore(max(1, self._settings.plugin_init_max_concurrency))
+        
+        async def initialize_bounded(tool: Tool) -> Any:
+            async with semaphore:
+                return await self._initialize_tool(tool, agent)
+        
+        tasks = [asyncio.create_task(initialize_bounded(tool)) for tool in tools]
+        try:
+            if strategy == "wait_first":
+                await self._wait_first(tasks)
+            else:
+                await asyncio.wait(tasks)
+        finally:
+            # Tasks must not outlive this call (e.g. when the caller is cancelled), or they
+            # would register plugins after cleanup_all_plugins has already run
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        
+        plugins = []
+        for task in tasks:
+            if task.cancelled():
+                continue
+            error = task.exception()
+            if error is not None:
+                # Explicitly re-raise OpenAPIPluginError to propagate to chat service
+                raise error
+            kernel_plugin = task.result()
+            if isinstance(kernel_plugin, list):
+                # Handlers that create several plugins for one tool (e.g. multi-server MCP)
+                plugins.extend(kernel_plugin)
+            elif kernel_plugin:
+                plugins.append(kernel_plugin)
         
         return plugins
+    
+    async def _initialize_tool(self, tool: Tool, agent: Agent) -> Any:
+        """Initialize a single tool and return its kernel plugin, or None if it failed."""
+        handler = self._plugin_handlers[tool.type]
+        try:
+            # Pass both plugin_manager and agent_id to all handlers
+            # This resolves an issue where sub-agents were being initialized and then cleaned up immediately
+            # and ensures plugins have unique keys across different agents
+            if tool.type == "Agent":
+                plugin_data = await _with_retry(
+                    lambda: handler.initialize(tool, plugin_manager=self, agent_id=agent.id),
+                    self._settings.plugin_init_max_retries
+                )
+            else:
+                plugin_data = await _with_retry(
+                    lambda: handler.initialize(tool, agent_id=agent.id),
+                    self._settings.plugin_init_max_retries
+                )
+            if plugin_data:
+                # Store both the handler and the plugin data for cleanup
+                self._active_plugins.append((handler, plugin_data))
+                # Get the kernel plugin representation
+                return await handler.get_kernel_plugin(plugin_data)
+        except OpenAPIPluginError:
+            logger.error(f"OpenAPIPluginError during plugin initialization for tool: {tool.id}")
+            raise
+        except Exception as e:
+            # Log other initialization errors but don't raise generic exceptions
+            # so that other plugins can still be loaded
+            logger.error(f"Error initializing plugin for tool {tool.id}: {str(e)}", exc_info=True)
+            # Don't add this failed plugin to the active plugins
+        return None
+    
+    @staticmethod
+    async def _wait_first(tasks: List[asyncio.Task]) -> None:
+        """Wait until one task yields a plugin (or fails); the caller cancels the rest."""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(task.exception() is not None or task.result() for task in done):
+                break
         
     async def cleanup_all_plugins(self):
-        """Clean up all active plugins."""
-        for handler, plugin_data in self._active_plugins:
-            try:
-                await handler.cleanup(plugin_data)
-            except Exception as e:
-                # Log but continue cleanup
-                logger.error(f"Error cleaning up plugin: {e}")
+        """Clean up all active plugins concurrently."""
+        async with asyncio.TaskGroup() as tg:
+            for handler, plugin_data in self._active_plugins:
+                tg.create_task(self._safe_cleanup(handler, plugin_data))
                 
-        self._active_plugins = []
\ No newline at end of file
+        self._active_plugins = []
+    
+    @staticmethod
+    async def _safe_cleanup(handler: PluginBase, plugin_data: Any) -> None:
+        """Clean up a single plugin, logging rather than raising on failure."""
+        try:
+            await handler.cleanup(plugin_data)
+        except Exception as e:
+            # Log but continue cleanup
+            logger.error(f"Error cleaning up plugin: {e}")
\ No newline at end of file
@@ -1,9 +1,12 @@
-from fastapi import APIRouter
+import json
 
-router = APIRouter()
+from fastapi import APIRouter, Response
 
-@router.get("/")
-def root() -> dict[str, str]:
-    return {"message": "AI Agents API"}
+router = APIRouter()
 
+# Serialized once; served as-is on every request
+_ROOT_BODY = json.dumps({"message": "AI Agents API"}, separators=(",", ":")).encode("utf-8")
 
+@router.get("/", response_class=Response)
+async def root() -> Response:
+    return Response(content=_ROOT_BODY, media_type="application/json")
@@ -1,24 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
-from opentelemetry import trace
-from opentelemetry.trace import SpanContext, format_trace_id
+from opentelemetry import context as otel_context, trace
+from opentelemetry.trace import format_trace_id
+import asyncio
+import contextvars
 import json
 import logging
 from typing import Any
-from app.models import ChatRequest, ChatResponse, Agent
-from app.services.chat_service import ChatService
-from app.config.azure_app_config import AzureAppConfig
+from app.models import ChatRequest, ChatResponse
+from app.services.chat_service import ChatService, FunctionCallEvent
+from app.services.agent_cache import AgentConfigCache
 from app.config.remote_config import RemoteConfig
 from app.dependencies import get_chat_service, get_remote_config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 router = APIRouter()
 tracer = trace.get_tracer(__name__)
 logger = logging.getLogger(__name__)
 
+# Seconds without output before a keep-alive comment is sent so proxies don't time out
+_KEEP_ALIVE_INTERVAL = 15
+
+# Tokens arriving within this many seconds of the first buffered one are sent as one event, up to a size limit
+_COALESCE_DELAY = 0.02
+_COALESCE_MAX_CHARS = 8192
+
+# Frames are written as bytes so the response doesn't re-encode every token
+_SSE_DONE = b"data: [DONE]\n\n"
+_SSE_PING = b": ping\n\n"
+_SSE_DATA_PREFIX = b"data: "
+_SSE_EVENT_END = b"\n\n"
+
+
+def _sse_event(content: str, event: str = "") -> bytes:
+    """Frame content as a server-sent event with a JSON payload."""
+    if orjson is not None:
+        data = orjson.dumps({"content": content})
+    else:
+        data = json.dumps({"content": content}).encode("utf-8")
+    if event:
+        return b"event: " + event.encode("utf-8") + b"\n" + _SSE_DATA_PREFIX + data + _SSE_EVENT_END
+    return _SSE_DATA_PREFIX + data + _SSE_EVENT_END
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    background_tasks: BackgroundTasks,
     chat_service: ChatService = Depends(get_chat_service),
     agent_config: RemoteConfig = Depends(get_remote_config)
 ) -> Any:
@@ -26,55 +56,128 @@ async def chat(
     Chat with an AI agent with streaming response.
     The response is streamed as server-sent events (SSE).
     """
-    with tracer.start_as_current_span("chat_endpoint") as span:
-        span.set_attribute("session_id", request.session_id)
-        span.set_attribute("agent_id", request.agent_id)
+    # Detached span: it is ended when the stream finishes rather than when the handler returns
+    span = tracer.start_span(
+        "chat_endpoint",
+        attributes={"session_id": request.session_id, "agent_id": request.agent_id}
+    )
 
-        # Get current span context to extract trace ID
-        current_span = trace.get_current_span()
-        span_context = current_span.get_span_context()
-        trace_id = format_trace_id(span_context.trace_id)
-        
-        # Fetch the agent configuration using agent_id
+    # Extract the trace ID from the span itself
+    trace_id = format_trace_id(span.get_span_context().trace_id)
+    
+    # Fetch the agent configuration using agent_id
+    try:
+        agent = await AgentConfigCache.get_instance().get(request.agent_id, agent_config)
+    except Exception as e:
+        logger.exception(f"Error fetching agent: {str(e)}")
+        span.end()
+        raise HTTPException(status_code=500, detail=f"Internal server error while fetching agent configuration. {str(e)}")
+
+    if agent is None:
+        span.end()
+        raise HTTPException(status_code=404, detail=f"Agent with ID '{request.agent_id}' not found")
+    
+    # Call the chat service to get the streaming response
+    async def stream_response():
+        chunks = chat_service.chat(
+            session_id=request.session_id,
+            agent=agent,
+            user_input=request.input,
+            attachments=request.attachments
+        )
+        # Every read runs in one shared context so spans opened inside the generator detach cleanly;
+        # the endpoint span is made current there once so the chat spans nest under it
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        context.run(otel_context.attach, trace.set_span_in_context(span))
+        next_chunk = None
+        # A piece read while coalescing that has to start the next event
+        carried = None
+        finished = False
         try:
-            agent = await agent_config.get(key=request.agent_id, model_type=Agent, prefix="agent:")     
+            while not finished:
+                if carried is not None:
+                    pieces = [carried]
+                    carried = None
+                else:
+                    # Wait on the same pending read across keep-alives; wait_for would cancel it
+                    if next_chunk is None:
+                        next_chunk = loop.create_task(chunks.__anext__(), context=context)
+                    while not (await asyncio.wait({next_chunk}, timeout=_KEEP_ALIVE_INTERVAL))[0]:
+                        yield _SSE_PING
+                    try:
+                        # ChatService.chat yields strings, with function call status as FunctionCallEvent
+                        pieces = [next_chunk.result()]
+                    except StopAsyncIteration:
+                        break
+                    next_chunk = None
+                
+                # Function call status is its own event so it never runs into model tokens
+                if isinstance(pieces[0], FunctionCallEvent):
+                    yield _sse_event(pieces[0], event="function_call")
+                    continue
+                
+                # Coalesce model tokens arriving within _COALESCE_DELAY of the first one into one event;
+                # the deadline is fixed so a steady stream of fast tokens still flushes on time
+                deadline = loop.time() + _COALESCE_DELAY
+                size = len(pieces[0])
+                while size < _COALESCE_MAX_CHARS:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    next_chunk = loop.create_task(chunks.__anext__(), context=context)
+                    if not (await asyncio.wait({next_chunk}, timeout=remaining))[0]:
+                        # Still pending; the outer loop keeps waiting on it
+                        break
+                    try:
+                        piece = next_chunk.result()
+                    except StopAsyncIteration:
+                        finished = True
+                        break
+                    except Exception:
+                        # Send the tokens already read before the error is reported
+                        yield _sse_event("".join(pieces))
+                        raise
+                    next_chunk = None
+                    if isinstance(piece, FunctionCallEvent):
+                        carried = piece
+                        break
+                    pieces.append(piece)
+                    size += len(piece)
+                
+                yield _sse_event("".join(pieces))
+            
+            # Sent only once the chat has finished, which includes saving the thread,
+            # so the client's next message always loads this turn
+            yield _SSE_DONE
+
         except Exception as e:
-            logger.exception(f"Error fetching agent: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Internal server error while fetching agent configuration. {str(e)}")
+            logger.exception(f"Error streaming response: {str(e)}")
+            span.record_exception(e)
+            span.set_attribute("error", str(e))
+            # Send error message as an event
+            yield _sse_event(f"An unexpected error occurred: {str(e)}", event="error")
+        finally:
+            try:
+                # Client disconnected mid-read: stop the chat instead of leaving it running
+                if next_chunk is not None and not next_chunk.done():
+                    next_chunk.cancel()
+                    await asyncio.wait({next_chunk})
+                # Closed in the same context as every read, so spans still open inside the generator detach cleanly
+                await loop.create_task(chunks.aclose(), context=context)
+            finally:
+                # Ended even if the cleanup above is cancelled again
+                span.end()
     
-        if agent is None:
-            raise HTTPException(status_code=404, detail=f"Agent with ID '{request.agent_id}' not found")
-        
-        # Call the chat service to get the streaming response
-        async def stream_response():
-            try:                # Get the streaming response from chat service
-                async for chunk in chat_service.chat(
-                    session_id=request.session_id,
-                    agent=agent,
-                    user_input=request.input,
-                    attachments=request.attachments
-                ):
-                    # # Extract the string content from the StreamingChatMessageContent object
-                    if hasattr(chunk, 'content'):
-                        content = chunk.content
-                    else:
-                        content = str(chunk)
-                    
-                    yield content
-
-            except Exception as e:
-                logger.exception(f"Error streaming response: {str(e)}")
-                span.record_exception(e)
-                span.set_attribute("error", str(e))
-                # Send error message as an event
-                yield f"An unexpected error occurred: {str(e)}"
-        
-        return StreamingResponse(
-            stream_response(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-OTel-Trace-ID": trace_id
-            }
-        )
\ No newline at end of file
+    return StreamingResponse(
+        stream_response(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            # Stop Nginx/Front Door from buffering the stream until it completes
+            "X-Accel-Buffering": "no",
+            "Content-Encoding": "identity",
+            "X-OTel-Trace-ID": trace_id
+        }
+    )
\ No newline at end of file
@@ -1,29 +1,69 @@
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-import os
-from azure.identity import DefaultAzureCredential
-from azure.ai.projects import AIProjectClient
+from fastapi.responses import ORJSONResponse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from azure.identity.aio import DefaultAzureCredential
+from azure.ai.projects.aio import AIProjectClient
 from azure.core.exceptions import HttpResponseError
 import logging
-from app.config.config import Settings
+from app.config import get_settings
 
 router = APIRouter()
 
-@router.get("/deployments", response_class=JSONResponse)
-def list_deployments():
+# Seconds a deployments listing is served from memory
+_DEPLOYMENTS_TTL_SECONDS = 60
+
+# Shared credential and client so tokens and connections are reused across requests
+_credential: Optional[DefaultAzureCredential] = None
+_project_client: Optional[AIProjectClient] = None
+_client_lock = asyncio.Lock()
+
+# Deployments by project endpoint with the time they were listed
+_deployments_cache: Dict[str, Tuple[List[Dict[str, Any]], float]] = {}
+
+
+async def _get_project_client(endpoint: str) -> AIProjectClient:
+    """Get the shared project client, creating it on first use."""
+    global _credential, _project_client
+    if _project_client is None:
+        async with _client_lock:
+            if _project_client is None:
+                _credential = DefaultAzureCredential()
+                _project_client = AIProjectClient(credential=_credential, endpoint=endpoint)
+    return _project_client
+
+
+async def close_project_client() -> None:
+    """Close the shared project client and credential (called on application shutdown)."""
+    global _credential, _project_client
+    if _project_client is not None:
+        await _project_client.close()
+        _project_client = None
+    if _credential is not None:
+        await _credential.close()
+        _credential = None
+
+
+@router.get("/deployments", response_class=ORJSONResponse)
+async def list_deployments():
     """
     List all AI model deployments in the Azure AI Foundry project.
     """
     try:
-        settings = Settings()
-        endpoint = settings.azure_ai_agent_endpoint
+        endpoint = get_settings().azure_ai_agent_endpoint
         if not endpoint:
             raise HTTPException(status_code=500, detail="AZURE_AI_AGENT_ENDPOINT config value not set.")
-        credential = DefaultAzureCredential()
-        project_client = AIProjectClient(credential=credential, endpoint=endpoint)
-        deployments = [d for d in project_client.deployments.list()]
-        deployments_data = [d.__dict__ for d in deployments]
-        return JSONResponse(content=deployments_data)
+
+        cached = _deployments_cache.get(endpoint)
+        if cached is not None and time.monotonic() - cached[1] < _DEPLOYMENTS_TTL_SECONDS:
+            return ORJSONResponse(content=cached[0])
+
+        project_client = await _get_project_client(endpoint)
+        # as_dict() gives the JSON-compatible fields (__dict__ exposed the model's private storage)
+        deployments_data = [d.as_dict() async for d in project_client.deployments.list()]
+        _deployments_cache[endpoint] = (deployments_data, time.monotonic())
+        return ORJSONResponse(content=deployments_data)
     except HttpResponseError as e:
         logging.exception(f"Azure error: {e}")
         raise HTTPException(status_code=e.status_code, detail=e.message)
@@ -1,9 +1,13 @@
+import json
+
 from fastapi import APIRouter, Response
 
 router = APIRouter()
 
+# Serialized once; probes are hit at high rates
+_READY_BODY = json.dumps({"status": "Ready"}, separators=(",", ":")).encode("utf-8")
+
 
-@router.get("/liveness")
-async def liveness_probe(response: Response):
-    response.status_code = 200
-    return {"status": "Ready"}
+@router.get("/liveness", response_class=Response)
+async def liveness_probe() -> Response:
+    return Response(content=_READY_BODY, media_type="application/json")
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.models import Agent
+from app.config.config import get_settings
+from app.config.remote_config import RemoteConfig
+
+logger = logging.getLogger(__name__)
+
+
+class AgentConfigCache:
+    """
+    In-process cache of agent configurations so chat requests don't pay an
+    Azure App Configuration round trip before any model work starts.
+    Entries expire after a short TTL so edits made in App Configuration are
+    picked up without a restart.
+    """
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls) -> "AgentConfigCache":
+        """Get the singleton instance of the cache."""
+        if cls._instance is None:
+            cls._instance = AgentConfigCache()
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the agent configuration cache."""
+        settings = get_settings()
+        self._ttl = settings.agent_config_cache_ttl_seconds
+        self._max_size = settings.agent_config_cache_max_size
+
+        # Agents by ID with the time they were fetched, least recently used first
+        self._agents: "OrderedDict[str, Tuple[Agent, float]]" = OrderedDict()
+
+        # In-flight fetches by agent ID so concurrent misses share one request; entries are
+        # removed as soon as the fetch completes, so unknown IDs leave nothing behind
+        self._inflight_fetches: Dict[str, asyncio.Task] = {}
+
+    def _lookup(self, agent_id: str) -> Optional[Agent]:
+        """Return a cached agent that has not expired."""
+        entry = self._agents.get(agent_id)
+        if entry is None:
+            return None
+        agent, fetched_at = entry
+        if time.monotonic() - fetched_at > self._ttl:
+            del self._agents[agent_id]
+            return None
+        self._agents.move_to_end(agent_id)
+        return agent
+
+    async def get(self, agent_id: str, config_client: RemoteConfig) -> Optional[Agent]:
+        """
+        Get an agent configuration, fetching it from remote configuration on a miss.
+        Missing agents (None) are not cached so newly created agents are found immediately.
+        """
+        if self._ttl <= 0:
+            return await config_client.get(key=agent_id, model_type=Agent, prefix="agent:")
+
+        agent = self._lookup(agent_id)
+        if agent is not None:
+            return agent
+
+        task = self._inflight_fetches.get(agent_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(agent_id, config_client))
+            self._inflight_fetches[agent_id] = task
+            task.add_done_callback(lambda _: self._inflight_fetches.pop(agent_id, None))
+        # Shield so one caller being cancelled doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(self, agent_id: str, config_client: RemoteConfig) -> Optional[Agent]:
+        """Fetch an agent from remote configuration and cache it if it exists."""
+        agent = await config_client.get(key=agent_id, model_type=Agent, prefix="agent:")
+        if agent is not None:
+            self._agents[agent_id] = (agent, time.monotonic())
+            if len(self._agents) > self._max_size:
+                self._agents.popitem(last=False)
+        return agent
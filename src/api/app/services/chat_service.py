@@ -1,11 +1,9 @@
 # app/services/chat_service.py
 import asyncio
-import json
+import contextlib
+import contextvars
 import logging
-import base64
-import os
-import re
-from typing import Dict, Any, AsyncGenerator, Optional, List, Tuple, Union, cast, TypeVar, Generic
+from typing import AsyncGenerator, AsyncIterator, Optional, List, Union, cast, TypeVar
 from opentelemetry import trace
 
 from app.models import Agent, Attachment
@@ -16,11 +14,9 @@ from app.services.kernel_factory import KernelFactory
 from app.services.thread_storage import ThreadStorage
 from app.services.function_call_stream import FunctionCallStream
 from app.services.file_processor import FileProcessor
-from app.config.config import get_settings
 
 # Semantic Kernel imports for multimodal support
 from semantic_kernel.contents import ImageContent, TextContent, ChatMessageContent
-from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.contents.utils.author_role import AuthorRole
 from semantic_kernel.agents import ChatCompletionAgent, ChatHistoryAgentThread, AzureAIAgent, AzureAIAgentThread
 
@@ -28,26 +24,65 @@ from semantic_kernel.agents import ChatCompletionAgent, ChatHistoryAgentThread,
 tracer = trace.get_tracer(__name__)
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# User-facing message for OpenAPI plugin failures
+_OPENAPI_ERROR_FORMAT = "Error with OpenAPI plugin '{name}' (ID: {id}): {message}".format
+
+# Attachments of one request processed at the same time, so a large upload can't take over
+# the worker threads document conversion runs on
+_MAX_CONCURRENT_ATTACHMENTS = 8
+
+
+class FunctionCallEvent(str):
+    """A function call status message, kept apart from the model's own tokens when streamed."""
+    __slots__ = ()
+
+
+async def _merge(*iterators: AsyncIterator[T]) -> AsyncGenerator[T, None]:
+    """Yield items from several async iterators as soon as each one produces them."""
+    loop = asyncio.get_running_loop()
+    # Each iterator keeps one context across reads so spans it opens detach cleanly
+    contexts = {iterator: contextvars.copy_context() for iterator in iterators}
+    pending = {loop.create_task(iterator.__anext__(), context=contexts[iterator]): iterator for iterator in iterators}
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                iterator = pending.pop(task)
+                try:
+                    item = task.result()
+                except StopAsyncIteration:
+                    continue
+                pending[loop.create_task(iterator.__anext__(), context=contexts[iterator])] = iterator
+                yield item
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
 class ChatService:
     def __init__(self, thread_storage: ThreadStorage):
         self.thread_storage = thread_storage
         self.file_processor = FileProcessor()
         
     async def chat(self, session_id: str, agent: Agent, user_input: str, attachments: Optional[List[Attachment]] = None) -> AsyncGenerator[str, None]:
-        """Process a chat request and generate a streaming response with optional attachments."""
-        with tracer.start_as_current_span("chat") as span:
-            span.set_attribute("session_id", session_id)
-            span.set_attribute("agent_id", agent.id)
-            
-            # Create kernel for this request
-            kernel = await KernelFactory.create_kernel(agent, session_id=session_id)
-            
-            # Try to load existing thread first
-            existing_thread = await self.thread_storage.load(session_id)
+        """Process a chat request and generate a streaming response with optional attachments.
+        
+        The thread is saved before the stream ends, so a client that sends its next message
+        as soon as the stream completes always loads this turn.
+        """
+        # A detached span covers the whole stream without being attached across every yield
+        span = tracer.start_span("chat", attributes={"session_id": session_id, "agent_id": agent.id})
+        try:
+            # Agent settings consulted more than once below
+            display_function_calls = agent.displayFunctionCallStatus
+            is_azure_ai_agent = agent.agentType == "AzureAIAgent"
             
             # If function call status should be displayed, prepare the function call stream
             function_stream = None
-            if agent.displayFunctionCallStatus:
+            if display_function_calls:
                 function_stream = FunctionCallStream.get_or_create(session_id)
             
             # Define thread at the method level so it can be shared
@@ -55,10 +90,19 @@ class ChatService:
             
             try:
                 async with PluginManager() as plugin_manager:
-                    # Initialize plugins for this agent
-                    try:
-                        plugins = await plugin_manager.initialize_plugins(agent)
-                    except OpenAPIPluginError as ope:
+                    # Create the kernel, load any existing thread and initialize plugins concurrently;
+                    # they are independent and each may involve network round trips
+                    kernel, existing_thread, plugins = await asyncio.gather(
+                        KernelFactory.create_kernel(agent, session_id=session_id),
+                        self.thread_storage.load(session_id),
+                        plugin_manager.initialize_plugins(agent),
+                        return_exceptions=True
+                    )
+                    for result in (kernel, existing_thread, plugins):
+                        if isinstance(result, BaseException) and not isinstance(result, OpenAPIPluginError):
+                            raise result
+                    if isinstance(plugins, OpenAPIPluginError):
+                        ope = plugins
                         # Format a user-friendly error message for OpenAPI plugin issues
                         error_message = self._format_openapi_error(ope)
                         logger.error(f"OpenAPI plugin error: {error_message}")
@@ -69,10 +113,12 @@ class ChatService:
                         yield error_message
                         return
                     
-                    # Check for existing thread first to make decisions about agent creation
+                    # Check for existing thread first to make decisions about agent creation;
+                    # a saved AzureAIAgentThread is stored as a SerializableThread holding its ID
+                    is_saved_azure_thread = getattr(existing_thread, 'thread_type', None) == "AzureAIAgentThread"
                     thread_id = None
-                    if existing_thread and hasattr(existing_thread, 'thread_type') and existing_thread.thread_type == "AzureAIAgentThread":
-                        if agent.agentType == "AzureAIAgent":
+                    if is_saved_azure_thread:
+                        if is_azure_ai_agent:
                             logger.info(f"Found saved AzureAIAgentThread with ID: {existing_thread.thread_id} for session {session_id}")
                             thread_id = existing_thread.thread_id
                     
@@ -90,11 +136,11 @@ class ChatService:
                     # Handle regular thread restoration for non-AzureAI threads
                     if existing_thread:
                         # Skip AzureAIAgentThread since we already handled it above
-                        if hasattr(existing_thread, 'thread_type') and existing_thread.thread_type == "AzureAIAgentThread":
-                            if agent.agentType == "AzureAIAgent":
+                        if is_saved_azure_thread:
+                            if is_azure_ai_agent:
                                 logger.info(f"Using restored AzureAIAgentThread with ID: {existing_thread.thread_id} for session {session_id}")
                             else:
-                                logger.warning(f"Found AzureAIAgentThread ID but agent is not AzureAIAgent type, using new thread")
+                                logger.warning("Found AzureAIAgentThread ID but agent is not AzureAIAgent type, using new thread")
                         # Use existing thread if it's the same type
                         elif isinstance(existing_thread, type(thread)):
                             logger.info(f"Using existing thread for session {session_id}")
@@ -102,11 +148,8 @@ class ChatService:
                         else:
                             logger.warning(f"Existing thread type {type(existing_thread)} not compatible with {type(thread)}, using new thread")
                     
-                    # Create a queue for merging content and function call events
-                    merged_queue = asyncio.Queue()
-                    
-                    # Define a task to process the content stream
-                    async def process_content_stream():
+                    # Stream the agent's response
+                    async def content_stream() -> AsyncGenerator[str, None]:
                         nonlocal thread
                         try:
                             # Process user input and attachments
@@ -124,73 +167,36 @@ class ChatService:
                                 # Update thread from response
                                 thread = response.thread
                                 
-                                # Extract content from response
-                                if hasattr(response, 'content'):
-                                    content = response.content
-                                else:
-                                    content = str(response)
-                                
-                                # Add to the queue
-                                await merged_queue.put({
-                                    "type": "content", 
-                                    "content": content
-                                })
+                                # Yield plain text so consumers never need to inspect the chunk type
+                                # (str() of a streaming message is its text and a no-op on str)
+                                yield str(response.content)
                                 
                         except Exception as e:
-                            # Put the error in the queue
                             logger.error(f"Error in content stream: {str(e)}", exc_info=True)
-                            await merged_queue.put({
-                                "type": "error",
-                                "content": f"Error: {str(e)}"
-                            })
+                            yield f"Error: {str(e)}"
                         finally:
-                            # Mark the content stream as done by putting None
-                            await merged_queue.put(None)
-                            
                             # Close the function stream when content stream is done
                             if function_stream:
                                 logger.info(f"Main content stream complete, closing function stream for session {session_id}")
                                 function_stream.close()
                     
-                    # Define a task to process function call events
-                    async def process_function_calls():
-                        if not function_stream:
-                            # No function stream, just mark as done
-                            await merged_queue.put(None)
-                            return
-                        
+                    # Stream function call events as they are reported
+                    async def function_call_stream() -> AsyncGenerator[str, None]:
                         try:
-                            # Process events from function stream
                             async for event in function_stream.get_events():
-                                await merged_queue.put({
-                                    "type": "function_call",
-                                    "content": event
-                                })
+                                yield FunctionCallEvent(event)
                         except Exception as e:
                             logger.error(f"Error processing function calls: {str(e)}", exc_info=True)
-                        finally:
-                            # Mark function call stream as done
-                            await merged_queue.put(None)
-                    
-                    # Start both tasks
-                    content_task = asyncio.create_task(process_content_stream())
-                    function_task = asyncio.create_task(process_function_calls())
                     
-                    # Count of active streams
-                    active_streams = 2
-                    
-                    # Process the merged queue
-                    while active_streams > 0:
-                        item = await merged_queue.get()
-                        if item is None:
-                            # One of the streams is done
-                            active_streams -= 1
-                        else:
-                            # Yield the item from the queue
-                            yield item["content"]
-                    
-                    # Wait for both tasks to complete
-                    await asyncio.gather(content_task, function_task)
+                    # Interleave content and function call events in arrival order
+                    streams = [content_stream()]
+                    if function_stream:
+                        streams.append(function_call_stream())
+                    # aclosing ends the merge (cancelling its pending reads) as soon as this
+                    # generator is closed, e.g. on client disconnect, rather than at garbage collection
+                    async with contextlib.aclosing(_merge(*streams)) as merged:
+                        async for item in merged:
+                            yield item
                     
                     # Persist thread after successful completion
                     if thread:
@@ -204,8 +210,10 @@ class ChatService:
             
             finally:
                 # Clean up function call stream
-                if agent.displayFunctionCallStatus:
+                if display_function_calls:
                     FunctionCallStream.cleanup(session_id)
+        finally:
+            span.end()
 
     async def _create_message_content_items(self, user_input: str, attachments: List[Attachment], agent: Agent, function_stream=None) -> List[Union[TextContent, ImageContent]]:
         """Create content items for chat messages from user input and attachments.
@@ -229,113 +237,129 @@ class ChatService:
             content_items.append(TextContent(text=user_input))
             return content_items
         
+        # Loop-invariant values are computed once rather than per attachment
+        loop = asyncio.get_running_loop()
+        attachment_count = len(attachments)
+        
         # Send initial status if function stream is available and there are attachments
-        overall_start_time = asyncio.get_event_loop().time()
+        overall_start_time = loop.time()
         if function_stream:
             function_stream.add_function_call({
                 "type": "function_start",
                 "plugin": "FileProcessor",
                 "function": "process_attachments",
-                "arguments": {"count": len(attachments), "status": f"🔄 Processing {len(attachments)} attachment(s)..."},
+                "arguments": {"count": attachment_count, "status": f"🔄 Processing {attachment_count} attachment(s)..."},
                 "is_auto": "Manual",
                 "timestamp": overall_start_time
             })
         
-        processed_content_parts = []
+        # Results are stored by position so concurrent processing keeps attachment order
+        image_items: List[Optional[ImageContent]] = [None] * attachment_count
+        text_parts: List[Optional[str]] = [None] * attachment_count
         image_attachments_processed = 0
         document_attachments_processed = 0
         
-        try:
-            for idx, attachment in enumerate(attachments):
-                logger.info(f"Processing attachment {idx+1}/{len(attachments)}: {attachment.name}")
-                
-                # Record start time for duration calculation
-                start_time = asyncio.get_event_loop().time()
-                
-                # Send processing status to function stream if available
-                if function_stream:
-                    function_stream.add_function_call({
-                        "type": "function_start",
-                        "plugin": "FileProcessor",
-                        "function": f"process_file_{idx+1}",
-                        "arguments": {"filename": attachment.name, "progress": f"{idx+1}/{len(attachments)}"},
-                        "is_auto": "Manual",
-                        "timestamp": start_time
-                    })
-                
-                # Use FileProcessor to handle the attachment
+        attachment_slots = asyncio.Semaphore(_MAX_CONCURRENT_ATTACHMENTS)
+        
+        async def process_attachment(idx: int, attachment: Attachment) -> None:
+            nonlocal image_attachments_processed, document_attachments_processed
+            logger.info(f"Processing attachment {idx+1}/{attachment_count}: {attachment.name}")
+            
+            # Record start time for duration calculation
+            start_time = loop.time()
+            
+            # Send processing status to function stream if available
+            if function_stream:
+                function_stream.add_function_call({
+                    "type": "function_start",
+                    "plugin": "FileProcessor",
+                    "function": f"process_file_{idx+1}",
+                    "arguments": {"filename": attachment.name, "progress": f"{idx+1}/{attachment_count}"},
+                    "is_auto": "Manual",
+                    "timestamp": start_time
+                })
+            
+            # Use FileProcessor to handle the attachment
+            async with attachment_slots:
                 processed_content, metadata = await self.file_processor.process_file_attachment(attachment)
-                
-                if metadata["type"] == "image":
-                    # For images, add as ImageContent (let the system error if model doesn't support it)
-                    try:
-                        mime_type = metadata["mime_type"].split(';')[0] if metadata["mime_type"] else "image/jpeg"
+            
+            if metadata["type"] == "image":
+                # For images, add as ImageContent (let the system error if model doesn't support it)
+                try:
+                    raw_mime_type = metadata.get("mime_type")
+                    mime_type = raw_mime_type.partition(';')[0].strip() if raw_mime_type else "image/jpeg"
+                    if metadata["data_format"] == "uri":
+                        image_content = ImageContent(uri=processed_content, mime_type=mime_type)
+                    else:
                         image_content = ImageContent(
                             data=processed_content,  # Base64 string from FileProcessor
                             data_format="base64",
                             mime_type=mime_type
                         )
-                        content_items.append(image_content)
-                        image_attachments_processed += 1
-                        
-                        logger.info(f"Added image as ImageContent: {attachment.name}")
-                        # Send completion status to function stream if available
-                        if function_stream:
-                            end_time = asyncio.get_event_loop().time()
-                            function_stream.add_function_call({
-                                "type": "function_end",
-                                "plugin": "FileProcessor",
-                                "function": f"process_file_{idx+1}",
-                                "status": "success",
-                                "result": f"✅ Image processed: {attachment.name}",
-                                "is_auto": "Manual",
-                                "timestamp": end_time,
-                                "start_timestamp": start_time
-                            })
-                            
-                    except Exception as img_error:
-                        logger.error(f"Error creating ImageContent for {attachment.name}: {str(img_error)}")
-                        # Fall back to text description
-                        processed_content_parts.append(f"[Image: {attachment.name}]")
-                
-                elif metadata["type"] == "document":
-                    # For documents, add the markdown content to the text
-                    processed_content_parts.append(processed_content)
-                    document_attachments_processed += 1
+                    image_items[idx] = image_content
+                    image_attachments_processed += 1
                     
-                    logger.info(f"Added document as text: {attachment.name}")
+                    logger.info(f"Added image as ImageContent: {attachment.name}")
                     # Send completion status to function stream if available
                     if function_stream:
-                        end_time = asyncio.get_event_loop().time()
+                        end_time = loop.time()
                         function_stream.add_function_call({
                             "type": "function_end",
                             "plugin": "FileProcessor",
                             "function": f"process_file_{idx+1}",
                             "status": "success",
-                            "result": f"✅ Document processed: {attachment.name}",
+                            "result": f"✅ Image processed: {attachment.name}",
                             "is_auto": "Manual",
                             "timestamp": end_time,
                             "start_timestamp": start_time
                         })
+                        
+                except Exception as img_error:
+                    logger.error(f"Error creating ImageContent for {attachment.name}: {str(img_error)}")
+                    # Fall back to text description
+                    text_parts[idx] = f"[Image: {attachment.name}]"
+            
+            elif metadata["type"] == "document":
+                # For documents, add the markdown content to the text
+                text_parts[idx] = processed_content
+                document_attachments_processed += 1
                 
-                elif metadata["type"] == "error":
-                    # Add error information to text
-                    processed_content_parts.append(processed_content)
-                    logger.warning(f"Error processing attachment {attachment.name}")
-        
-            # Combine user input with processed attachment content
-            if processed_content_parts:
-                combined_text = user_input + "\n\n" + "\n\n".join(processed_content_parts)
-            else:
-                combined_text = user_input
+                logger.info(f"Added document as text: {attachment.name}")
+                # Send completion status to function stream if available
+                if function_stream:
+                    end_time = loop.time()
+                    function_stream.add_function_call({
+                        "type": "function_end",
+                        "plugin": "FileProcessor",
+                        "function": f"process_file_{idx+1}",
+                        "status": "success",
+                        "result": f"✅ Document processed: {attachment.name}",
+                        "is_auto": "Manual",
+                        "timestamp": end_time,
+                        "start_timestamp": start_time
+                    })
             
-            content_items.insert(0, TextContent(text=combined_text))
+            elif metadata["type"] == "error":
+                # Add error information to text
+                text_parts[idx] = processed_content
+                logger.warning(f"Error processing attachment {attachment.name}")
+        
+        try:
+            # Attachments are independent, so process them concurrently; if one fails
+            # the task group cancels the rest instead of leaving them running
+            async with asyncio.TaskGroup() as task_group:
+                for idx, attachment in enumerate(attachments):
+                    task_group.create_task(process_attachment(idx, attachment))
+        
+            # Combine user input with processed attachment content in one join, text first
+            combined_text = "\n\n".join([user_input, *(part for part in text_parts if part is not None)])
+            content_items = [TextContent(text=combined_text), *(item for item in image_items if item is not None)]
             
             logger.info(f"Processed {image_attachments_processed} images and {document_attachments_processed} documents")
             
             # Send final processing summary to function stream if available
             if function_stream and (image_attachments_processed > 0 or document_attachments_processed > 0):
-                end_time = asyncio.get_event_loop().time()
+                end_time = loop.time()
                 function_stream.add_function_call({
                     "type": "function_end",
                     "plugin": "FileProcessor",
@@ -357,4 +381,4 @@ class ChatService:
 
     def _format_openapi_error(self, error: OpenAPIPluginError) -> str:
         """Format OpenAPI plugin error into a user-friendly message."""
-        return f"Error with OpenAPI plugin '{error.tool_name}' (ID: {error.tool_id}): {error.message}"
+        return _OPENAPI_ERROR_FORMAT(name=error.tool_name, id=error.tool_id, message=error.message)
@@ -1,9 +1,13 @@
 # app/services/file_processor.py
+import asyncio
 import base64
+import hashlib
 import logging
 import tempfile
+import threading
 import os
 import io
+from collections import OrderedDict
 from typing import Optional, Dict, Any, Tuple, TYPE_CHECKING
 from pathlib import Path
 
@@ -15,8 +19,54 @@ try:
 except ImportError:
     MarkItDown = None
 
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
 logger = logging.getLogger(__name__)
 
+# SIMD-accelerated decoding when pybase64 is installed
+_b64decode = pybase64.b64decode if pybase64 is not None else base64.b64decode
+
+# Markdown conversions by document content, type and extension, least recently used first;
+# conversion runs in worker threads, so access is guarded by a lock
+_CONVERTED_DOCUMENTS: "OrderedDict[Tuple[bytes, str, str], str]" = OrderedDict()
+_CONVERTED_DOCUMENTS_MAX_SIZE = 64
+_converted_documents_lock = threading.Lock()
+
+
+# Common types that MarkItDown can handle
+_PROCESSABLE_TYPES = frozenset({
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.ms-powerpoint',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'text/plain',
+    'text/csv',
+    'text/html',
+    'text/markdown',
+    'application/json',
+    'application/xml',
+    'text/javascript',
+    'text/css',
+    'application/javascript',
+})
+
+
+def _base64_payload(url: str) -> str:
+    """Return the base64 payload of a data URL, or the value itself if it isn't one."""
+    if url.startswith('data:'):
+        # The header ends at the first comma (base64 has none), so only the header is scanned
+        comma = url.find(',')
+        if comma != -1 and url.endswith(';base64', 0, comma):
+            return url[comma + 1:]
+    return url
+
+
 class FileProcessor:
     """Service for processing various file types into formats suitable for AI agents."""
     
@@ -37,27 +87,7 @@ class FileProcessor:
         if not self.markitdown:
             return False
         
-        # Common types that MarkItDown can handle
-        processable_types = {
-            'application/pdf',
-            'application/msword',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/vnd.ms-excel',
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'application/vnd.ms-powerpoint',
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'text/plain',
-            'text/csv',
-            'text/html',
-            'text/markdown',
-            'application/json',
-            'application/xml',
-            'text/javascript',
-            'text/css',
-            'application/javascript',
-        }
-        
-        return mime_type in processable_types
+        return mime_type in _PROCESSABLE_TYPES
     
     async def process_file_attachment(self, attachment: 'Attachment') -> Tuple[str, Dict[str, Any]]:
         """
@@ -65,7 +95,7 @@ class FileProcessor:
         
         Returns:
             Tuple of (processed_content, metadata)
-            - For images: returns base64 data and image metadata
+            - For images: returns base64 data (or the URL of a remote image) and image metadata
             - For other files: returns markdown content and file metadata
         """
         try:
@@ -84,11 +114,17 @@ class FileProcessor:
     
     async def _process_image(self, attachment: 'Attachment') -> Tuple[str, Dict[str, Any]]:
         """Process image attachments."""
+        # Remote images are passed through by URL for the model service to fetch
+        if attachment.url.startswith(('http://', 'https://')):
+            return attachment.url, {
+                "type": "image",
+                "file_name": attachment.name,
+                "mime_type": attachment.type,
+                "data_format": "uri"
+            }
+        
         # Extract base64 data from data URL if needed
-        if attachment.url.startswith('data:') and ';base64,' in attachment.url:
-            base64_data = attachment.url.split(';base64,', 1)[1]
-        else:
-            base64_data = attachment.url
+        base64_data = _base64_payload(attachment.url)
         
         return base64_data, {
             "type": "image",
@@ -107,39 +143,8 @@ class FileProcessor:
             }
         
         try:
-            # Decode base64 data
-            if attachment.url.startswith('data:') and ';base64,' in attachment.url:
-                base64_data = attachment.url.split(';base64,', 1)[1]
-            else:
-                base64_data = attachment.url
-            
-            file_data = base64.b64decode(base64_data)
-            
-            # Try using BytesIO first (more efficient, no temp files)
-            try:
-                file_stream = io.BytesIO(file_data)
-                file_stream.name = attachment.name  # Some converters need a filename
-                result = self.markitdown.convert(file_stream)
-                markdown_content = result.text_content if hasattr(result, 'text_content') else str(result)
-                logger.debug(f"Successfully processed {attachment.name} using BytesIO")
-            except Exception as stream_error:
-                logger.debug(f"BytesIO approach failed for {attachment.name}, falling back to temp file: {stream_error}")
-                
-                # Fallback to temporary file approach
-                with tempfile.NamedTemporaryFile(delete=False, suffix=self._get_file_extension(attachment.name)) as temp_file:
-                    temp_file.write(file_data)
-                    temp_file_path = temp_file.name
-                
-                try:
-                    result = self.markitdown.convert(temp_file_path)
-                    markdown_content = result.text_content if hasattr(result, 'text_content') else str(result)
-                    logger.debug(f"Successfully processed {attachment.name} using temporary file")
-                finally:
-                    # Clean up temporary file
-                    try:
-                        os.unlink(temp_file_path)
-                    except Exception as cleanup_error:
-                        logger.warning(f"Could not clean up temp file {temp_file_path}: {cleanup_error}")
+            # Decoding and conversion are CPU-bound, so keep them off the event loop
+            markdown_content = await asyncio.to_thread(self._convert_document, attachment)
             
             # Add file information header
             file_header = f"# File: {attachment.name}\n\n"
@@ -163,6 +168,58 @@ class FileProcessor:
                 "mime_type": attachment.type
             }
     
+    def _convert_document(self, attachment: 'Attachment') -> str:
+        """Decode a document attachment and convert it to markdown (runs in a worker thread)."""
+        base64_data = _base64_payload(attachment.url)
+        
+        # Files re-sent in later turns reuse their earlier conversion
+        cache_key = (
+            hashlib.sha256(base64_data.encode()).digest()[:16],
+            attachment.type,
+            self._get_file_extension(attachment.name),
+        )
+        with _converted_documents_lock:
+            markdown_content = _CONVERTED_DOCUMENTS.get(cache_key)
+            if markdown_content is not None:
+                _CONVERTED_DOCUMENTS.move_to_end(cache_key)
+                return markdown_content
+        
+        # Decode base64 data
+        file_data = _b64decode(base64_data)
+        
+        # Try using BytesIO first (more efficient, no temp files)
+        try:
+            file_stream = io.BytesIO(file_data)
+            file_stream.name = attachment.name  # Some converters need a filename
+            result = self.markitdown.convert(file_stream)
+            markdown_content = result.text_content if hasattr(result, 'text_content') else str(result)
+            logger.debug("Successfully processed %s using BytesIO", attachment.name)
+        except Exception as stream_error:
+            logger.debug("BytesIO approach failed for %s, falling back to temp file: %s", attachment.name, stream_error)
+            
+            # Fallback to temporary file approach
+            with tempfile.NamedTemporaryFile(delete=False, suffix=self._get_file_extension(attachment.name)) as temp_file:
+                temp_file.write(file_data)
+                temp_file_path = temp_file.name
+            
+            try:
+                result = self.markitdown.convert(temp_file_path)
+                markdown_content = result.text_content if hasattr(result, 'text_content') else str(result)
+                logger.debug("Successfully processed %s using temporary file", attachment.name)
+            finally:
+                # Clean up temporary file
+                try:
+                    os.unlink(temp_file_path)
+                except Exception as cleanup_error:
+                    logger.warning(f"Could not clean up temp file {temp_file_path}: {cleanup_error}")
+        
+        with _converted_documents_lock:
+            _CONVERTED_DOCUMENTS[cache_key] = markdown_content
+            if len(_CONVERTED_DOCUMENTS) > _CONVERTED_DOCUMENTS_MAX_SIZE:
+                _CONVERTED_DOCUMENTS.popitem(last=False)
+        
+        return markdown_content
+    
     def _get_file_extension(self, filename: str) -> str:
         """Extract file extension from filename."""
         return Path(filename).suffix or '.tmp'
@@ -5,9 +5,22 @@ import json
 from typing import Dict, Any, AsyncGenerator
 from opentelemetry import trace
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 tracer = trace.get_tracer(__name__)
 
+
+def _pretty_json(value: Any) -> str:
+    """Serialize a value as indented JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(value, indent=2, ensure_ascii=False)
+
+
 class FunctionCallStream:
     """
     A stream for handling function call events in real-time.
@@ -48,7 +61,7 @@ class FunctionCallStream:
         try:
             # Add the event to the queue
             self.queue.put_nowait(call_info)
-            logger.debug(f"Added function call event to stream: {call_info.get('function', '')}")
+            logger.debug("Added function call event to stream: %s", call_info.get('function', ''))
         except Exception as e:
             logger.error(f"Error adding function call to stream: {str(e)}")
     
@@ -105,7 +118,7 @@ class FunctionCallStream:
         if call_info.get("arguments"):
             try:
                 # Format JSON with indentation for better readability
-                formatted_args = json.dumps(call_info["arguments"], indent=2, ensure_ascii=False)
+                formatted_args = _pretty_json(call_info["arguments"])
                 details = f"\n```json\n{formatted_args}\n```\n"
             except Exception:
                 # Fallback to simple string representation if JSON formatting fails
@@ -149,7 +162,7 @@ class FunctionCallStream:
             try:
                 # Try to parse result as JSON for prettier formatting
                 result_obj = json.loads(call_info["result"]) if isinstance(call_info["result"], str) else call_info["result"]
-                formatted_result = json.dumps(result_obj, indent=2, ensure_ascii=False)
+                formatted_result = _pretty_json(result_obj)
                 result_details = f"\n**Result:**\n```json\n{formatted_result}\n```\n"
             except (json.JSONDecodeError, TypeError):
                 # If not valid JSON, just show as plain text
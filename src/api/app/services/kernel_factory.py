@@ -86,7 +86,7 @@ class KernelFactory:
                         
                         # Log the function call with more context
                         prefix = "[AUTO]"
-                        logger.debug(f"{prefix} Function called: {plugin_name}.{function_name} with arguments: {safe_args}")
+                        logger.debug("%s Function called: %s.%s with arguments: %s", prefix, plugin_name, function_name, safe_args)
                         
                         # Execute the function
                         try:
@@ -122,7 +122,7 @@ class KernelFactory:
                             
                             # Log the function completion with more context
                             duration_ms = (end_time - start_time) * 1000
-                            logger.debug(f"{prefix} Function completed: {plugin_name}.{function_name} with status: {status} in {duration_ms:.2f}ms")
+                            logger.debug("%s Function completed: %s.%s with status: %s in %.2fms", prefix, plugin_name, function_name, status, duration_ms)
 
                 # Add the auto function invocation filter
                 kernel.add_filter(FilterTypes.AUTO_FUNCTION_INVOCATION, auto_function_filter)
@@ -1,10 +1,17 @@
 # app/services/openapi_spec_cache.py
 import logging
+import hashlib
 import httpx
 import json
+import os
+import re
+import stat
+import tempfile
 import yaml
 import asyncio
 import time
+from collections import OrderedDict
+from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
 from opentelemetry import trace
@@ -12,10 +19,214 @@ from opentelemetry import trace
 from app.models import Agent, Tool
 from app.config.azure_app_config import AzureAppConfig
 from app.config.config import get_settings
+from app.telemetry import start_span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 tracer = trace.get_tracer(__name__)
 
+# Use the LibYAML C loader when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Parsed specs by SHA-256 of the raw response body, most recently used last
+_PARSED_SPECS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_PARSED_SPECS_MAX_SIZE = 32
+
+# A JSON document starts with an object or array; anything else can only be YAML
+_JSON_START_RE = re.compile(rb"\s*[\[{]")
+
+# Documents above this size are parsed off the event loop and pruned after parsing
+_LARGE_SPEC_BYTES = 1024 * 1024
+
+# Operations the OpenAPI plugin exposes (keep in sync with its operation predicate);
+# other operations are dropped from large specs so they aren't retained or walked
+_HTTP_METHODS = frozenset({"get", "put", "post", "delete", "options", "head", "patch", "trace"})
+_EXPOSED_METHODS = frozenset({"get", "post", "put"})
+
+
+def _json_key(key: Any) -> str:
+    """Convert a YAML mapping key to the string json.dumps would write for it."""
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, bool):
+        return json.dumps(key)
+    return str(key)
+
+
+def _stringify_keys(value: Any) -> Any:
+    """Convert non-string mapping keys (e.g. integer response codes) the way JSON would."""
+    if isinstance(value, dict):
+        return {_json_key(key): _stringify_keys(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_stringify_keys(item) for item in value]
+    return value
+
+
+def _load_yaml(content: bytes) -> Dict[str, Any]:
+    """Load a YAML document with the same string keys a JSON document would have,
+    so a spec parsed from YAML matches one read back from the JSON disk cache."""
+    return _stringify_keys(yaml.load(content, Loader=_YAML_LOADER))
+
+
+def _decode_spec(content: bytes) -> Dict[str, Any]:
+    """Decode a raw OpenAPI document, trying JSON first and falling back to YAML."""
+    if not _JSON_START_RE.match(content):
+        # Skip the failing JSON attempt for YAML documents
+        return _load_yaml(content)
+    try:
+        return orjson.loads(content) if orjson is not None else json.loads(content)
+    except ValueError:
+        # Not JSON (orjson and json decode errors are both ValueErrors), try YAML
+        return _load_yaml(content)
+
+
+def _prune_operations(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove operations the plugin never exposes from a parsed spec, in place."""
+    paths = spec.get("paths") if isinstance(spec, dict) else None
+    if not isinstance(paths, dict):
+        return spec
+    for path_item in paths.values():
+        if not isinstance(path_item, dict):
+            continue
+        unused = [
+            key for key in path_item
+            if isinstance(key, str) and key.lower() in _HTTP_METHODS and key.lower() not in _EXPOSED_METHODS
+        ]
+        for key in unused:
+            del path_item[key]
+    return spec
+
+
+def _decode_large_spec(content: bytes) -> Dict[str, Any]:
+    """Decode a large OpenAPI document and prune it before it is cached."""
+    return _prune_operations(_decode_spec(content))
+
+
+async def _parse_spec_bytes(content: bytes) -> Dict[str, Any]:
+    """Parse a raw OpenAPI document, reusing the result for identical documents."""
+    digest = hashlib.sha256(content).hexdigest()
+    spec = _PARSED_SPECS.get(digest)
+    if spec is not None:
+        _PARSED_SPECS.move_to_end(digest)
+        return spec
+    
+    if len(content) > _LARGE_SPEC_BYTES:
+        # Multi-MB documents take long enough to parse that they would stall other requests
+        spec = await asyncio.to_thread(_decode_large_spec, content)
+    else:
+        spec = _decode_spec(content)
+    _PARSED_SPECS[digest] = spec
+    if len(_PARSED_SPECS) > _PARSED_SPECS_MAX_SIZE:
+        _PARSED_SPECS.popitem(last=False)
+    return spec
+
+
+def _dump_spec(spec: Dict[str, Any]) -> bytes:
+    """Serialize a parsed spec to JSON bytes for the disk cache."""
+    # Keys are already strings (see _load_yaml), so both encoders write the same document
+    if orjson is not None:
+        return orjson.dumps(spec)
+    return json.dumps(spec).encode("utf-8")
+
+
+class SpecDiskCache:
+    """
+    Parsed OpenAPI specs persisted as JSON so that cold starts (and every uvicorn
+    worker) can skip YAML parsing and, when the server supports validators, the download.
+    Each URL has a small .meta file holding its ETag/Last-Modified and the content key
+    of the spec file written for it.
+    """
+    
+    def __init__(self, directory: Path):
+        self._directory = directory
+    
+    def prepare(self) -> bool:
+        """
+        Create the cache directory if needed and check that it is safe to trust.
+        Cached specs decide where authenticated tool calls are sent, so a directory
+        another user could have created or written to (e.g. a predictable path under
+        a shared temp dir) is refused rather than read from.
+        """
+        try:
+            self._directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            info = os.lstat(self._directory)
+        except OSError as e:
+            logger.warning(f"Could not create OpenAPI spec disk cache directory {self._directory}: {str(e)}")
+            return False
+        if not stat.S_ISDIR(info.st_mode):
+            logger.warning(f"OpenAPI spec disk cache path {self._directory} is not a directory; disk cache disabled")
+            return False
+        if hasattr(os, "getuid"):
+            if info.st_uid != os.getuid():
+                logger.warning(f"OpenAPI spec disk cache directory {self._directory} is owned by another user; disk cache disabled")
+                return False
+            if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+                logger.warning(f"OpenAPI spec disk cache directory {self._directory} is writable by other users; disk cache disabled")
+                return False
+        return True
+        
+    @staticmethod
+    def _url_key(url: str, headers: Dict[str, str]) -> str:
+        """Key the metadata by URL and the headers that were sent to fetch it."""
+        material = url + "\n" + "\n".join(f"{name}:{value}" for name, value in sorted(headers.items()))
+        return hashlib.blake2b(material.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def read_meta(self, url: str, headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Return the stored validators for a URL, if its spec file still exists."""
+        try:
+            meta = json.loads((self._directory / f"{self._url_key(url, headers)}.meta").read_bytes())
+        except (OSError, ValueError):
+            return None
+        if not (self._directory / f"{meta.get('content_key')}.json").exists():
+            return None
+        return meta
+    
+    def read_spec(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Load the parsed spec a metadata entry points at."""
+        raw = (self._directory / f"{meta['content_key']}.json").read_bytes()
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    
+    def write(self, url: str, headers: Dict[str, str], raw: bytes, spec: Dict[str, Any],
+              etag: Optional[str], last_modified: Optional[str]) -> None:
+        """Persist a parsed spec and the validators of the response it came from."""
+        url_key = self._url_key(url, headers)
+        meta_path = self._directory / f"{url_key}.meta"
+        # Content files belong to a single metadata entry, so the one it pointed at before can be removed
+        try:
+            previous_key = json.loads(meta_path.read_bytes()).get("content_key")
+        except (OSError, ValueError):
+            previous_key = None
+        
+        content_key = hashlib.blake2b(url_key.encode("utf-8") + raw, digest_size=16).hexdigest()
+        meta = {"content_key": content_key, "etag": etag, "last_modified": last_modified}
+        self._write_atomic(self._directory / f"{content_key}.json", _dump_spec(spec))
+        self._write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+        
+        if previous_key and previous_key != content_key:
+            try:
+                (self._directory / f"{previous_key}.json").unlink()
+            except OSError:
+                pass
+    
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        """Write to a temporary file and rename it so readers never see partial files."""
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
 class OpenAPISpecCache:
     """
     A cache for OpenAPI specifications to avoid fetching them repeatedly.
@@ -46,6 +257,17 @@ class OpenAPISpecCache:
         # Authentication information by spec URL
         self._auth_map: Dict[str, List] = {}
         
+        # Per-URL locks so concurrent cache misses share a single fetch
+        self._fetch_locks: Dict[str, asyncio.Lock] = {}
+        
+        # In-flight uncached fetches and background refreshes by URL, shared by concurrent callers
+        self._inflight_fetches: Dict[str, asyncio.Task] = {}
+        self._inflight_refreshes: Dict[str, asyncio.Task] = {}
+        
+        # Shared HTTP client (created lazily) so spec fetches reuse pooled connections
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._http_client_lock = asyncio.Lock()
+        
         # Flag to track if refresh task is running
         self._refresh_task = None
         
@@ -58,6 +280,12 @@ class OpenAPISpecCache:
         
         # Cache configuration
         self._enable_cache = getattr(settings, "openapi_cache_enabled", True)
+        self._disk_cache = None
+        if self._enable_cache and settings.openapi_disk_cache_enabled:
+            cache_dir = settings.openapi_cache_dir or os.path.join(tempfile.gettempdir(), "openapi_specs")
+            disk_cache = SpecDiskCache(Path(cache_dir))
+            if disk_cache.prepare():
+                self._disk_cache = disk_cache
         self._cache_ttl = getattr(settings, "openapi_cache_ttl_seconds", 3600)  # 1 hour default
         self._refresh_interval = getattr(settings, "openapi_cache_refresh_interval_seconds", 300)  # 5 minutes default
         
@@ -169,13 +397,13 @@ class OpenAPISpecCache:
         # If cache is disabled, always fetch
         if not self._enable_cache:
             try:
-                return await self._fetch_openapi_spec(spec_url, authentications)
+                return await self._fetch_shared(spec_url, authentications)
             except Exception as e:
                 logger.error(f"Error fetching OpenAPI spec: {str(e)}", exc_info=True)
                 return None
                 
         try:
-            with tracer.start_as_current_span("get_spec") as span:
+            with start_span(tracer, "get_spec") as span:
                 span.set_attribute("url", spec_url)
                 
                 # Check if in cache first
@@ -189,11 +417,14 @@ class OpenAPISpecCache:
                         last_fetch_time = self._cache_timestamps.get(spec_url, 0)
                         
                         # If the cache entry is getting stale (> 75% of TTL), trigger a background refresh
-                        if current_time - last_fetch_time > (self._cache_ttl * 0.75):
+                        # unless one is already running for this URL
+                        if current_time - last_fetch_time > (self._cache_ttl * 0.75) and spec_url not in self._inflight_refreshes:
                             logger.debug(f"Background refreshing stale spec: {spec_url}")
                             # Schedule a background refresh without waiting for result
                             # Use create_task with error handling
                             refresh_task = asyncio.create_task(self._fetch_and_cache_spec(spec_url, authentications, is_refresh=True))
+                            self._inflight_refreshes[spec_url] = refresh_task
+                            refresh_task.add_done_callback(lambda _, url=spec_url: self._inflight_refreshes.pop(url, None))
                             
                             # Add error handling for the background task
                             refresh_task.add_done_callback(
@@ -206,9 +437,13 @@ class OpenAPISpecCache:
                     # Return cached spec immediately, regardless of refresh status
                     return self._spec_cache[spec_url]
                 
-                # Not in cache, fetch and cache it
+                # Not in cache, fetch and cache it once even if several tools ask concurrently
                 span.set_attribute("cache_hit", False)
-                return await self._fetch_and_cache_spec(spec_url, authentications)
+                lock = self._fetch_locks.setdefault(spec_url, asyncio.Lock())
+                async with lock:
+                    if spec_url in self._spec_cache:
+                        return self._spec_cache[spec_url]
+                    return await self._fetch_and_cache_spec(spec_url, authentications)
         except Exception as e:
             # Catch all exceptions to ensure this method never fails
             logger.error(f"Unexpected error in get_spec for {spec_url}: {str(e)}", exc_info=True)
@@ -220,6 +455,16 @@ class OpenAPISpecCache:
                 logger.error(f"Direct fetch also failed for {spec_url}: {str(fetch_error)}")
                 return None
     
+    async def _fetch_shared(self, spec_url: str, authentications: List = None) -> Dict[str, Any]:
+        """Fetch a spec without caching, sharing one in-flight request between concurrent callers."""
+        task = self._inflight_fetches.get(spec_url)
+        if task is None:
+            task = asyncio.create_task(self._fetch_openapi_spec(spec_url, authentications))
+            self._inflight_fetches[spec_url] = task
+            task.add_done_callback(lambda _: self._inflight_fetches.pop(spec_url, None))
+        # Shield so one caller being cancelled doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
+    
     async def _fetch_and_cache_spec(self, spec_url: str, authentications: List = None, is_refresh: bool = False) -> Optional[Dict[str, Any]]:
         """Fetch an OpenAPI spec and cache it."""
         try:
@@ -245,13 +490,26 @@ class OpenAPISpecCache:
     async def clear_cache(self) -> None:
         """Clear the entire cache."""
         self._spec_cache.clear()
+        _PARSED_SPECS.clear()
         self._cache_timestamps.clear()
         self._auth_map.clear()
         logger.info("Cleared OpenAPI spec cache")
     
+    async def _get_http_client(self) -> httpx.AsyncClient:
+        """Get the HTTP client used for spec fetches, creating it on first use."""
+        if self._http_client is None:
+            async with self._http_client_lock:
+                if self._http_client is None:
+                    self._http_client = httpx.AsyncClient(
+                        http2=True,
+                        timeout=httpx.Timeout(30.0, connect=10.0),
+                        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+                    )
+        return self._http_client
+    
     async def _fetch_openapi_spec(self, url: str, authentications: List = None) -> Dict[str, Any]:
         """Fetch and parse an OpenAPI specification from a URL."""
-        with tracer.start_as_current_span("fetch_openapi_spec") as span:
+        with start_span(tracer, "fetch_openapi_spec") as span:
             span.set_attribute("url", url)
             headers = {}
             
@@ -264,17 +522,40 @@ class OpenAPISpecCache:
             
             # Use async HTTP client with timeout and proper error handling
             try:
-                timeout = httpx.Timeout(30.0, connect=10.0)
-                async with httpx.AsyncClient(timeout=timeout) as client:
-                    response = await client.get(url, headers=headers)
-                    response.raise_for_status()
-                    
-                    # Try to parse as JSON first
+                # Revalidate against the on-disk copy when we have one
+                meta = None
+                request_headers = headers
+                if self._disk_cache:
+                    meta = await asyncio.to_thread(self._disk_cache.read_meta, url, headers)
+                    if meta:
+                        request_headers = dict(headers)
+                        if meta.get("etag"):
+                            request_headers["If-None-Match"] = meta["etag"]
+                        if meta.get("last_modified"):
+                            request_headers["If-Modified-Since"] = meta["last_modified"]
+                
+                client = await self._get_http_client()
+                response = await client.get(url, headers=request_headers)
+                
+                if response.status_code == 304 and meta:
+                    span.set_attribute("disk_cache_hit", True)
+                    return await asyncio.to_thread(self._disk_cache.read_spec, meta)
+                response.raise_for_status()
+                
+                # Parse as JSON first, then YAML; identical documents are parsed once
+                spec = await _parse_spec_bytes(response.content)
+                
+                if self._disk_cache:
                     try:
-                        return response.json()
-                    except json.JSONDecodeError:
-                        # If not JSON, try as YAML
-                        return yaml.safe_load(response.text)
+                        await asyncio.to_thread(
+                            self._disk_cache.write, url, headers, response.content, spec,
+                            response.headers.get("ETag"), response.headers.get("Last-Modified")
+                        )
+                    except Exception as e:
+                        # The disk cache is an optimization only
+                        logger.warning(f"Could not write OpenAPI spec disk cache for {url}: {str(e)}")
+                
+                return spec
                     
             except httpx.HTTPStatusError as e:
                 logger.error(f"HTTP error fetching OpenAPI spec: {e.response.status_code} {str(e)}")
@@ -302,6 +583,11 @@ class OpenAPISpecCache:
                 pass
             self._refresh_task = None
             
+        # Close the shared HTTP client
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+            
         # Clear the cache
         await self.clear_cache()
         logger.info("OpenAPI spec cache cleanup complete")
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import abc
+import asyncio
 import pickle
 import base64
 import logging
@@ -28,6 +29,16 @@ class SerializableThread:
         self.thread_id = thread_id
         self.metadata = metadata or {}
 
+def _serialize(obj: Any) -> str:
+    """Pickle an object and base64-encode it for storage."""
+    return base64.b64encode(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)).decode('ascii')
+
+
+def _deserialize(data: str) -> Any:
+    """Reverse _serialize."""
+    return pickle.loads(base64.b64decode(data))
+
+
 # Global storage that persists across instances
 _GLOBAL_MEMORY_STORAGE = {}
 
@@ -73,8 +84,7 @@ class InMemoryThreadStorage(ThreadStorage[T]):
                         thread_id=thread_id
                     )
                     # Use serialization for the wrapper
-                    serialized_bytes = pickle.dumps(serializable)
-                    serialized_thread = base64.b64encode(serialized_bytes).decode('ascii') if self.use_serialization else serializable
+                    serialized_thread = _serialize(serializable) if self.use_serialization else serializable
                     self._storage[session_id] = serialized_thread
                     logger.debug(f"Saved AzureAIAgentThread ID {thread_id} for session {session_id} to memory")
                     return
@@ -85,9 +95,7 @@ class InMemoryThreadStorage(ThreadStorage[T]):
             # Regular serialization for other thread types
             if self.use_serialization:
                 # Use base64 encoding for consistency with other storage methods
-                serialized_bytes = pickle.dumps(thread)
-                serialized_thread = base64.b64encode(serialized_bytes).decode('ascii')
-                self._storage[session_id] = serialized_thread
+                self._storage[session_id] = _serialize(thread)
             else:
                 # Store directly for better performance in development
                 self._storage[session_id] = thread
@@ -104,8 +112,7 @@ class InMemoryThreadStorage(ThreadStorage[T]):
             try:
                 if self.use_serialization:
                     # Deserialize with base64 decoding
-                    binary_data = base64.b64decode(data)
-                    thread = pickle.loads(binary_data)
+                    thread = _deserialize(data)
                 else:
                     thread = data
                     
@@ -152,8 +159,7 @@ class RedisThreadStorage(ThreadStorage[T]):
                         thread_id=thread_id
                     )
                     # Serialize the wrapper instead of the thread
-                    serialized_bytes = pickle.dumps(serializable)
-                    serialized_thread = base64.b64encode(serialized_bytes).decode('ascii')
+                    serialized_thread = _serialize(serializable)
                     
                     key = f"thread:{session_id}"
                     await client.set(key, serialized_thread, ex=self.ttl_seconds)
@@ -163,9 +169,8 @@ class RedisThreadStorage(ThreadStorage[T]):
                     logger.warning(f"AzureAIAgentThread has no ID, cannot save for session {session_id}")
                     return
             
-            # Use base64 encoding for consistent serialization
-            serialized_bytes = pickle.dumps(thread)
-            serialized_thread = base64.b64encode(serialized_bytes).decode('ascii')
+            # Pickling a long history is CPU-bound, so keep it off the event loop
+            serialized_thread = await asyncio.to_thread(_serialize, thread)
             
             key = f"thread:{session_id}"
             await client.set(key, serialized_thread, ex=self.ttl_seconds)
@@ -182,9 +187,8 @@ class RedisThreadStorage(ThreadStorage[T]):
             serialized_thread = await client.get(key)
             
             if serialized_thread:
-                # Deserialize with base64 decoding
-                binary_data = base64.b64decode(serialized_thread)
-                thread = pickle.loads(binary_data)
+                # Deserialize with base64 decoding off the event loop
+                thread = await asyncio.to_thread(_deserialize, serialized_thread)
                 logger.info(f"Loaded thread for session {session_id} from Redis")
                 return thread
             return None
@@ -265,8 +269,7 @@ class CosmosDbThreadStorage(ThreadStorage[T]):
                         thread_id=thread_id
                     )
                     # Serialize the wrapper instead of the thread
-                    serialized_bytes = pickle.dumps(serializable)
-                    serialized_thread = base64.b64encode(serialized_bytes).decode('ascii')
+                    serialized_thread = _serialize(serializable)
                     
                     # Create document with configurable partition key
                     document = {
@@ -284,9 +287,9 @@ class CosmosDbThreadStorage(ThreadStorage[T]):
                     logger.warning(f"AzureAIAgentThread has no ID, cannot save for session {session_id}")
                     return
             
-            # Serialize the thread using base64 encoding for better compatibility
-            serialized_bytes = pickle.dumps(thread)
-            serialized_thread = base64.b64encode(serialized_bytes).decode('ascii')
+            # Serialize the thread using base64 encoding; pickling a long history is
+            # CPU-bound, so keep it off the event loop
+            serialized_thread = await asyncio.to_thread(_serialize, thread)
             
             # Create document with configurable partition key
             document = {
@@ -316,10 +319,8 @@ class CosmosDbThreadStorage(ThreadStorage[T]):
             )]
             
             if items:
-                # Deserialize the thread using base64 decoding
-                serialized_thread = items[0]['thread']
-                binary_data = base64.b64decode(serialized_thread)
-                thread = pickle.loads(binary_data)
+                # Deserialize the thread using base64 decoding off the event loop
+                thread = await asyncio.to_thread(_deserialize, items[0]['thread'])
                 logger.info(f"Loaded thread for session {session_id} from Cosmos DB")
                 return thread
                 
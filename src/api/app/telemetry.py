@@ -1,4 +1,6 @@
 import logging
+from contextlib import nullcontext
+from typing import ContextManager
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
@@ -34,6 +36,21 @@ from .config import get_settings
 # Configure logger
 logger = logging.getLogger(__name__)
 
+# Set once setup_telemetry has configured an exporter
+_tracing_enabled = False
+
+
+def start_span(tracer: trace.Tracer, name: str) -> ContextManager[trace.Span]:
+    """
+    Start a span as the current span when tracing is configured.
+    
+    Without an exporter this yields the shared non-recording span instead, so hot
+    paths skip span and context creation while set_attribute calls stay valid no-ops.
+    """
+    if _tracing_enabled:
+        return tracer.start_as_current_span(name)
+    return nullcontext(trace.INVALID_SPAN)
+
 def setup_telemetry(app: FastAPI, service_name: str = "ai-agents-api"):
     """
     Configure OpenTelemetry with Azure Monitor exporter
@@ -54,6 +71,7 @@ def setup_telemetry(app: FastAPI, service_name: str = "ai-agents-api"):
     logging.getLogger('opentelemetry').addHandler(console_handler)
 
 
+    global _tracing_enabled
     settings = get_settings()
     
     # Try to get connection string from settings
@@ -89,6 +107,7 @@ def setup_telemetry(app: FastAPI, service_name: str = "ai-agents-api"):
     
     # Instrument FastAPI
     FastAPIInstrumentor.instrument_app(app)
+    _tracing_enabled = True
     
     logger.info("OpenTelemetry with Azure Monitor exporter has been set up")
     
@@ -0,0 +1,5 @@
+import os
+
+# Settings has required Azure endpoints; tests never call them
+os.environ.setdefault("AZURE_AI_ENDPOINT", "https://ai.example.invalid")
+os.environ.setdefault("AZURE_APP_CONFIG_ENDPOINT", "https://appconfig.example.invalid")
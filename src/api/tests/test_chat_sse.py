@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.dependencies import get_chat_service, get_remote_config
+from app.routes.chat import router
+from app.services.agent_cache import AgentConfigCache
+from app.services.chat_service import FunctionCallEvent
+
+
+class FakeChatService:
+    def __init__(self, pieces, error=None, delay=0):
+        self.pieces = pieces
+        self.error = error
+        self.delay = delay
+
+    async def chat(self, session_id, agent, user_input, attachments=None):
+        for piece in self.pieces:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield piece
+        if self.error is not None:
+            raise self.error
+
+
+class FakeAgentCache:
+    async def get(self, agent_id, config_client):
+        return object() if agent_id == "agent" else None
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    monkeypatch.setattr(AgentConfigCache, "get_instance", classmethod(lambda cls: FakeAgentCache()))
+
+    def make_client(chat_service):
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        app.dependency_overrides[get_chat_service] = lambda: chat_service
+        app.dependency_overrides[get_remote_config] = lambda: None
+        return TestClient(app)
+
+    return make_client
+
+
+def _post_chat(client, agent_id="agent"):
+    return client.post("/api/chat", json={"session_id": "session", "agent_id": agent_id, "input": "hi"})
+
+
+def _events(body):
+    """Split an SSE body into (event name, data) pairs."""
+    events = []
+    for frame in body.split("\n\n"):
+        if not frame:
+            continue
+        event, data = "", None
+        for line in frame.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = line[len("data: "):]
+        events.append((event, data))
+    return events
+
+
+def _frames(events):
+    return [json.loads(data)["content"] for event, data in events if event == "" and data not in (None, "[DONE]")]
+
+
+def _text(events):
+    return "".join(_frames(events))
+
+
+def test_stream_ends_with_done(make_client):
+    response = _post_chat(make_client(FakeChatService(["Hel", "lo"])))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    assert events[-1] == ("", "[DONE]")
+    assert _text(events) == "Hello"
+
+
+def test_fast_tokens_are_flushed_by_the_coalesce_deadline(make_client):
+    # Tokens 5 ms apart never leave a 20 ms gap, so only a deadline from the first token flushes them
+    tokens = [f"t{i} " for i in range(60)]
+    response = _post_chat(make_client(FakeChatService(tokens, delay=0.005)))
+
+    frames = _frames(_events(response.text))
+    assert "".join(frames) == "".join(tokens)
+    # The first frame holds about 20 ms of tokens (with slack for timer granularity), not the whole reply
+    assert len(frames[0].split()) <= 6
+    assert len(frames) > 1
+
+
+def test_function_calls_are_separate_events(make_client):
+    call = FunctionCallEvent("\n**Calling** `lookup`\n")
+    response = _post_chat(make_client(FakeChatService(["Let me check", call, "Found it"])))
+
+    events = _events(response.text)
+    function_calls = [json.loads(data)["content"] for event, data in events if event == "function_call"]
+    assert function_calls == [str(call)]
+    assert _text(events) == "Let me checkFound it"
+    assert events[-1] == ("", "[DONE]")
+
+
+def test_error_is_sent_as_error_event(make_client):
+    response = _post_chat(make_client(FakeChatService(["partial"], error=RuntimeError("boom"))))
+
+    events = _events(response.text)
+    assert _text(events) == "partial"
+    event, data = events[-1]
+    assert event == "error"
+    assert "boom" in json.loads(data)["content"]
+    assert ("", "[DONE]") not in events
+
+
+def test_unknown_agent_is_not_found(make_client):
+    response = _post_chat(make_client(FakeChatService([])), agent_id="missing")
+
+    assert response.status_code == 404
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+from app.plugins import mcp_plugin
+from app.plugins.mcp_plugin import MCPPluginHandler, MCPStdioProcessPool
+
+
+class FakeSession:
+    def __init__(self):
+        self.alive = True
+
+    async def send_ping(self):
+        if not self.alive:
+            raise ConnectionError("server exited")
+
+
+class FakeStdioPlugin:
+    """Records which task connects and closes it, like the anyio scopes in the real plugin care about."""
+
+    instances = []
+
+    def __init__(self, name, description, command, args, env=None, connection_timeout=None):
+        self.name = name
+        self.session = None
+        self.connected_in = None
+        self.closed_in = None
+        FakeStdioPlugin.instances.append(self)
+
+    async def connect(self):
+        self.connected_in = asyncio.current_task()
+        self.session = FakeSession()
+
+    async def close(self):
+        self.closed_in = asyncio.current_task()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakeStdioPlugin.instances = []
+    monkeypatch.setattr(mcp_plugin, "MCPStdioPlugin", FakeStdioPlugin)
+    pool = MCPStdioProcessPool()
+    pool._max_idle_per_key = 1
+    pool._idle_ttl = 300
+    return pool
+
+
+async def _acquire(pool, name="server"):
+    return await pool.acquire(name=name, description="", command="npx", args=["-y", "server"])
+
+
+def test_released_plugin_is_reused(pool):
+    async def run():
+        plugin = await _acquire(pool)
+        assert pool.owns(plugin)
+        await pool.release(plugin)
+        assert not pool.owns(plugin)
+        assert await _acquire(pool) is plugin
+        await pool.close_all()
+
+    asyncio.run(run())
+    assert len(FakeStdioPlugin.instances) == 1
+
+
+def test_connect_and_close_run_in_the_same_task(pool):
+    async def run():
+        plugin = await _acquire(pool)
+        await pool.release(plugin)
+        await pool.close_all()
+        return plugin
+
+    plugin = asyncio.run(run())
+    assert plugin.closed_in is not None
+    assert plugin.closed_in is plugin.connected_in
+
+
+def test_release_beyond_capacity_closes_plugin(pool):
+    async def run():
+        first = await _acquire(pool)
+        second = await _acquire(pool)
+        await pool.release(first)
+        await pool.release(second)
+        # Checked before close_all, which closes the idle one too
+        assert first.closed_in is None
+        assert second.closed_in is not None
+        await pool.close_all()
+
+    asyncio.run(run())
+
+
+def test_expired_idle_plugin_is_evicted(pool):
+    pool._idle_ttl = -1
+
+    async def run():
+        plugin = await _acquire(pool)
+        await pool.release(plugin)
+        replacement = await _acquire(pool)
+        return plugin, replacement
+
+    plugin, replacement = asyncio.run(run())
+    assert replacement is not plugin
+    assert plugin.closed_in is not None
+
+
+def test_dead_idle_plugin_is_discarded(pool):
+    async def run():
+        plugin = await _acquire(pool)
+        await pool.release(plugin)
+        plugin.session.alive = False
+        replacement = await _acquire(pool)
+        return plugin, replacement
+
+    plugin, replacement = asyncio.run(run())
+    assert replacement is not plugin
+    assert plugin.closed_in is not None
+
+
+def test_sweep_closes_expired_plugins_of_every_key(pool):
+    async def run():
+        plugin = await _acquire(pool, name="unused")
+        await pool.release(plugin)
+        pool._idle_ttl = -1
+        await pool._sweep()
+        assert plugin.closed_in is plugin.connected_in
+        assert not pool._idle
+
+    asyncio.run(run())
+
+
+def test_servers_are_only_pooled_when_they_opt_in(pool):
+    handler = MCPPluginHandler()
+    handler._pool = pool
+    config = {"command": "npx", "args": ["-y", "server"]}
+
+    async def run():
+        plugin = await handler._connect_server(config, "server")
+        assert not pool.owns(plugin)
+        await handler._release(plugin)
+        assert plugin.closed_in is plugin.connected_in
+
+        pooled = await handler._connect_server({**config, "pooled": True}, "server")
+        assert pool.owns(pooled)
+        await handler._release(pooled)
+        assert pooled.closed_in is None
+        await pool.close_all()
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from app.services.openapi_spec_cache import OpenAPISpecCache, SpecDiskCache, _decode_spec
+
+SPEC_URL = "https://api.example.com/openapi.json"
+SPEC_BODY = b'{"openapi": "3.0.0", "info": {"title": "Example", "version": "1"}, "paths": {}}'
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    cache = SpecDiskCache(tmp_path / "specs")
+    assert cache.prepare()
+    return cache
+
+
+def test_write_then_read_round_trip(disk_cache):
+    spec = _decode_spec(SPEC_BODY)
+    disk_cache.write(SPEC_URL, {}, SPEC_BODY, spec, '"v1"', None)
+
+    meta = disk_cache.read_meta(SPEC_URL, {})
+    assert meta["etag"] == '"v1"'
+    assert disk_cache.read_spec(meta) == spec
+
+
+def test_meta_is_keyed_by_request_headers(disk_cache):
+    spec = _decode_spec(SPEC_BODY)
+    disk_cache.write(SPEC_URL, {"X-Api-Key": "a"}, SPEC_BODY, spec, '"v1"', None)
+
+    assert disk_cache.read_meta(SPEC_URL, {"X-Api-Key": "b"}) is None
+
+
+def test_yaml_keys_match_after_round_trip(disk_cache):
+    raw = b"openapi: 3.0.0\npaths:\n  /items:\n    get:\n      responses:\n        200:\n          description: ok\n"
+    spec = _decode_spec(raw)
+    disk_cache.write(SPEC_URL, {}, raw, spec, '"v1"', None)
+
+    assert disk_cache.read_spec(disk_cache.read_meta(SPEC_URL, {})) == spec
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions only")
+def test_writable_by_others_directory_is_refused(tmp_path):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    directory.chmod(0o777)
+
+    assert not SpecDiskCache(directory).prepare()
+
+
+def _spec_cache(disk_cache, handler):
+    # Skip __init__, which builds an App Configuration client
+    cache = OpenAPISpecCache.__new__(OpenAPISpecCache)
+    cache._disk_cache = disk_cache
+    cache._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    cache._http_client_lock = asyncio.Lock()
+    return cache
+
+
+def test_not_modified_response_is_served_from_disk(disk_cache):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=SPEC_BODY, headers={"ETag": '"v1"'})
+
+    async def run():
+        cache = _spec_cache(disk_cache, handler)
+        try:
+            first = await cache._fetch_openapi_spec(SPEC_URL)
+            second = await cache._fetch_openapi_spec(SPEC_URL)
+        finally:
+            await cache._http_client.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert second == first
+    assert "If-None-Match" not in requests[0].headers
+    assert requests[1].headers["If-None-Match"] == '"v1"'
+
+
+def test_changed_spec_replaces_disk_copy(disk_cache):
+    bodies = iter([
+        (SPEC_BODY, '"v1"'),
+        (SPEC_BODY.replace(b'"version": "1"', b'"version": "2"'), '"v2"'),
+    ])
+
+    def handler(request):
+        body, etag = next(bodies)
+        return httpx.Response(200, content=body, headers={"ETag": etag})
+
+    async def run():
+        cache = _spec_cache(disk_cache, handler)
+        try:
+            await cache._fetch_openapi_spec(SPEC_URL)
+            return await cache._fetch_openapi_spec(SPEC_URL)
+        finally:
+            await cache._http_client.aclose()
+
+    spec = asyncio.run(run())
+    assert spec["info"]["version"] == "2"
+    assert disk_cache.read_meta(SPEC_URL, {})["etag"] == '"v2"'
+    # The superseded content file is removed rather than left behind
+    assert len(list(disk_cache._directory.glob("*.json"))) == 1
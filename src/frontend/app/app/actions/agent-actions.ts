@@ -266,6 +266,52 @@ export async function submitFeedback(feedback: FeedbackData): Promise<void> {
   console.log("Feedback submitted:", feedback)
 }
 
+// Convert the chat API's server-sent events ({"content": ...} payloads) into plain text for the UI
+function sseToText(): TransformStream<Uint8Array, Uint8Array> {
+  const decoder = new TextDecoder()
+  const encoder = new TextEncoder()
+  let buffer = ""
+
+  const emitEvent = (rawEvent: string, controller: TransformStreamDefaultController<Uint8Array>) => {
+    const data = rawEvent
+      .split("\n")
+      .filter((line) => line.startsWith("data:"))
+      .map((line) => line.slice(5).replace(/^ /, ""))
+      .join("\n")
+
+    // Skip keep-alive comments and the end-of-stream marker
+    if (!data || data === "[DONE]") {
+      return
+    }
+
+    try {
+      const payload = JSON.parse(data) as { content?: string }
+      if (payload.content) {
+        controller.enqueue(encoder.encode(payload.content))
+      }
+    } catch {
+      controller.enqueue(encoder.encode(data))
+    }
+  }
+
+  return new TransformStream({
+    transform(chunk, controller) {
+      buffer += decoder.decode(chunk, { stream: true })
+      const events = buffer.split("\n\n")
+      buffer = events.pop() ?? ""
+      for (const rawEvent of events) {
+        emitEvent(rawEvent, controller)
+      }
+    },
+    flush(controller) {
+      buffer += decoder.decode()
+      if (buffer) {
+        emitEvent(buffer, controller)
+      }
+    },
+  })
+}
+
 // Replace the sendMessage function with this simplified version that handles plain text streaming
 
 export async function sendMessage(
@@ -331,8 +377,8 @@ export async function sendMessage(
 
     // Check if the response is a stream
     if (response.body) {
-      // Return the raw stream - we'll handle the text in the UI
-      return { stream: response.body, traceId, sessionId: finalSessionId }
+      // Unwrap the server-sent events so the UI receives plain text
+      return { stream: response.body.pipeThrough(sseToText()), traceId, sessionId: finalSessionId }
     } else {
       // If the response doesn't have a body, create an error stream
       return {